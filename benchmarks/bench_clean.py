@@ -0,0 +1,50 @@
+"""
+Benchmark of ast_clean over a corpus of synthetic submissions
+
+Usage: python -m benchmarks.bench_clean [-n SUBMISSIONS] [-r REPEAT]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.generator import generate_functions
+from helper.clean_code import ast_clean
+from helper.report import Report
+
+def generate_corpus(size: int, seed: int = 0) -> list[str]:
+    """
+    Function that returns a reproducible corpus of synthetic submissions, a third of their
+    functions being forbidden
+    """
+    rng = random.Random(seed)
+    return [generate_functions(rng, rng.randint(5, 40), .3) for _ in range(size)]
+
+
+def bench(corpus: list[str], repeat: int) -> float:
+    """
+    Function that returns the best time, in seconds, to clean the whole corpus
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i, code in enumerate(corpus):
+            ast_clean(code, Report(f'student_{i}'))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ast_clean on synthetic submissions')
+    parser.add_argument('-n', '--submissions', type=int, default=1000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    namespace = parser.parse_args()
+
+    corpus = generate_corpus(namespace.submissions)
+    lines = sum(code.count('\n') for code in corpus)
+    best = bench(corpus, namespace.repeat)
+    print(f'{len(corpus)} submissions, {lines} lines')
+    print(f'total: {best * 1000:.1f} ms, per file: {best / len(corpus) * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the list_ guard inserted around list literals, against plain lists and
+against wrapping the literal itself, as the inserter used to
+
+Usage: python -m benchmarks.bench_list_guard [-n NUMBER] [-r REPEAT]
+"""
+import argparse
+import timeit
+from _ast import Call, List, Load, Name
+from ast import NodeTransformer, fix_missing_locations, parse
+
+from helper.insert_code import ASTInserter, prelude
+
+# Student-like hot loops, with small lists built at every iteration
+SNIPPETS = {
+    'empty': 'i = 0\nwhile i < 1000:\n    x = []\n    i = i + 1\n',
+    'constant': 'i = 0\nwhile i < 1000:\n    x = [1, 2, 3]\n    i = i + 1\n',
+    'variables': 'i = 0\nwhile i < 1000:\n    x = [i, i + 1, i + 2]\n    i = i + 1\n',
+    'nested': 'i = 0\nwhile i < 1000:\n    x = [[i], [i, i], []]\n    i = i + 1\n',
+    'repeat': 'i = 0\nwhile i < 1000:\n    x = [0] * 16\n    i = i + 1\n',
+}
+
+
+class ListWrapper(NodeTransformer):
+    """The former inserter, passing every list literal to list_"""
+
+    def visit_List(self, node: List) -> Call:
+        self.generic_visit(node)
+        return Call(func=Name(id='list_', ctx=Load()), args=[node], keywords=[])
+
+
+def compile_snippet(source: str, transformer: NodeTransformer | None):
+    node = parse(source)
+    if transformer is not None:
+        node = fix_missing_locations(transformer.visit(node))
+    return compile(node, '<snippet>', 'exec')
+
+
+def bench(source: str, transformer: NodeTransformer | None, number: int, repeat: int) -> float:
+    """
+    Function that returns the best time, in seconds, of a run of the snippet
+    """
+    code = compile_snippet(source, transformer)
+    namespace = dict(prelude())
+    return min(timeit.repeat(lambda: exec(code, namespace), number=number,
+                             repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the list_ guard on list literals')
+    parser.add_argument('-n', '--number', type=int, default=200)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    namespace = parser.parse_args()
+
+    print(f'{"snippet":<10} {"plain":>10} {"wrapped":>10} {"guard":>10} {"overhead":>9}')
+    for name, source in SNIPPETS.items():
+        plain, wrapped, guard = (bench(source, transformer, namespace.number, namespace.repeat)
+                                 for transformer in (None, ListWrapper(), ASTInserter()))
+        print(f'{name:<10} {plain * 1e6:>8.1f}us {wrapped * 1e6:>8.1f}us {guard * 1e6:>8.1f}us '
+              f'{guard / plain:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark of the whole pipeline on a synthetic cohort: ast_clean, ast_compile (the insert
+phase), mouli_runner end to end and mouli_runner --static-only
+
+Usage: python -m benchmarks.bench_pipeline [-n SIZE] [--mix SHAPE=WEIGHT,...] [-r REPEAT]
+                                            [-j JOBS] [-t TIMEOUT] [--json PATH]
+"""
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.generator import add_cohort_arguments, generate_cohort
+from helper.clean_code import ast_clean
+from helper.insert_code import ast_compile
+from helper.report import Report
+from mouli_runner import mouli_runner
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss() -> dict[str, int]:
+    """
+    Function that returns the peak resident set size of this process and of its children, in KiB
+    """
+    if resource is None:
+        return {}
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+
+
+def best_of(repeat: int, func, setup=lambda: None) -> float:
+    """
+    Function that returns the best time, in seconds, of repeat calls of func(setup())
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        func(args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_static(sources: list[tuple[str, str]], repeat: int) -> dict[str, float]:
+    """
+    Function that returns the best times of the clean and insert phases over the sources
+    """
+    def clean(_):
+        for name, code in sources:
+            ast_clean(code, Report(name))
+
+    def cleaned_nodes():
+        return [(name, ast_clean(code, Report(name))[0]) for name, code in sources]
+
+    def insert(nodes):
+        for name, node in nodes:
+            if node is not None:
+                ast_compile(node, name)
+
+    return {'ast_clean': best_of(repeat, clean), 'ast_insert': best_of(repeat, insert,
+                                                                       cleaned_nodes)}
+
+
+def bench_runner(folder: Path, repeat: int, jobs: int | None, timeout: float
+                 ) -> dict[str, float]:
+    """
+    Function that returns the best time of mouli_runner on the folder, without the cache, and
+    its best time to first result
+    """
+    profile = folder / 'profile.json'
+    args = [str(folder), '--no-cache', '-o', str(folder / 'output.csv'), '-t', str(timeout),
+            '--profile-json', str(profile)]
+    if jobs is not None:
+        args += ['-j', str(jobs)]
+    first = []
+
+    def run(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            mouli_runner(args)
+        first.append(json.loads(profile.read_text(encoding='utf-8'))['first'])
+
+    return {'mouli_runner': best_of(repeat, run), 'first_result': min(first)}
+
+
+def bench_static_only(folder: Path, repeat: int, jobs: int | None) -> float:
+    """
+    Function that returns the best time of mouli_runner --static-only on the folder
+    """
+    args = [str(folder), '--static-only', '-o', str(folder / 'static.csv')]
+    if jobs is not None:
+        args += ['-j', str(jobs)]
+
+    def run(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            mouli_runner(args)
+
+    return best_of(repeat, run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on a synthetic cohort')
+    add_cohort_arguments(parser)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('-t', '--timeout', type=float, default=1.)
+    parser.add_argument('--json', type=Path, help='Save the results as a json file')
+    namespace = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = generate_cohort(Path(tmp) / 'cohort', namespace.size, namespace.seed,
+                                 namespace.mix)
+        sources = [(file.name, file.read_text(encoding='utf-8'))
+                   for file in sorted(folder.glob('student_*.py'))]
+        results = bench_static(sources, namespace.repeat)
+        runner = bench_runner(folder, namespace.repeat, namespace.jobs, namespace.timeout)
+        results['mouli_runner'] = runner['mouli_runner']
+        results['static_only'] = bench_static_only(folder, namespace.repeat, namespace.jobs)
+
+    size = len(sources)
+    print(f'{size} submissions, {sum(code.count(chr(10)) for _, code in sources)} lines')
+    for stage, seconds in results.items():
+        print(f'{stage:<14}{seconds * 1000:>10.1f} ms {seconds / size * 1e6:>10.1f} us/file'
+              f'{size / seconds:>10.1f} files/s')
+    print(f'first result after {runner["first_result"] * 1000:.1f} ms')
+    rss = peak_rss()
+    for process, kib in rss.items():
+        print(f'peak RSS ({process}): {kib / 1024:.1f} MiB')
+
+    if namespace.json is not None:
+        namespace.json.write_text(json.dumps({
+            'size': size,
+            'mix': namespace.mix,
+            'seed': namespace.seed,
+            'seconds': results,
+            'files_per_second': {stage: size / seconds for stage, seconds in results.items()},
+            'first_result': runner['first_result'],
+            'peak_rss_kib': rss,
+        }, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
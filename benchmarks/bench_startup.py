@@ -0,0 +1,103 @@
+"""
+Benchmark of the startup of the runner: import time of mouli_runner, as python -X importtime
+reports it, spawn cost of a worker with each start method, and time from launching the runner
+to its first graded submission
+
+Usage: python -m benchmarks.bench_startup [-n SIZE] [-r REPEAT] [-j JOBS]
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.generator import generate_cohort
+from helper.workers import WorkerPool
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def import_times(module: str = 'mouli_runner') -> dict[str, tuple[int, int]]:
+    """
+    Function that returns the (self, cumulative) import time of every module imported by the
+    module, in microseconds, from a fresh interpreter
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def spawn_cost(start_method: str, processes: int) -> float:
+    """
+    Function that returns the time, in seconds, to start a pool with each start method and
+    get a first result from each of its workers, per worker
+    """
+    start = time.perf_counter()
+    with WorkerPool(processes=processes, start_method=start_method) as p:
+        for i in range(processes):
+            p.submit(i, os.getpid)
+        for _ in p.results():
+            pass
+    return (time.perf_counter() - start) / processes
+
+
+def first_result(folder: Path, start_method: str, jobs: int | None) -> float:
+    """
+    Function that returns the time, in seconds, from launching the runner on the folder to its
+    first graded submission
+    """
+    args = [sys.executable, '-u', str(ROOT / 'mouli_runner.py'), str(folder), '--no-cache',
+            '-o', str(folder / 'output.csv'), '--start-method', start_method]
+    if jobs is not None:
+        args += ['-j', str(jobs)]
+    start = time.perf_counter()
+    with subprocess.Popen(args, cwd=ROOT, stdout=subprocess.PIPE, text=True) as process:
+        elapsed = None
+        for line in process.stdout:
+            if elapsed is None and line.rstrip().endswith(' done'):
+                elapsed = time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of the runner')
+    parser.add_argument('-n', '--size', type=int, default=20)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    namespace = parser.parse_args()
+    methods = multiprocessing.get_all_start_methods()
+    processes = namespace.jobs or os.cpu_count()
+
+    runs = [import_times() for _ in range(namespace.repeat)]
+    best = min(runs, key=lambda times: times['mouli_runner'][1])
+    print(f'import mouli_runner: {best["mouli_runner"][1] / 1000:.1f} ms')
+    for name, (own, cumulative) in sorted(best.items(), key=lambda item: -item[1][0]
+                                          )[:namespace.top]:
+        print(f'  {name:<32}{own / 1000:>8.1f} ms self {cumulative / 1000:>8.1f} ms total')
+
+    print(f'worker spawn cost, {processes} workers:')
+    for method in methods:
+        cost = min(spawn_cost(method, processes) for _ in range(namespace.repeat))
+        print(f'  {method:<12}{cost * 1000:>8.1f} ms per worker')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = generate_cohort(Path(tmp) / 'cohort', namespace.size, mix={'clean': 1})
+        print(f'first result, {namespace.size} submissions:')
+        for method in methods:
+            elapsed = min(first_result(folder, method, namespace.jobs)
+                          for _ in range(namespace.repeat))
+            print(f'  {method:<12}{elapsed * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
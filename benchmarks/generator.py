@@ -0,0 +1,166 @@
+"""
+Generator of synthetic cohorts: a folder with a moulinette.py and one submission per student
+
+Usage: python -m benchmarks.generator FOLDER [-n SIZE] [--mix SHAPE=WEIGHT,...] [--seed SEED]
+"""
+import argparse
+import random
+from pathlib import Path
+
+MOULINETTE = '''from types import ModuleType
+
+from helper.report import Report
+
+
+def exercice_1(module: ModuleType, report: Report) -> None:
+    try:
+        if list(module.my_list(3)) != [3, 3, 3]:
+            report.add_malus_note("my_list(3) should return [3, 3, 3]")
+        else:
+            report.add_bonus_note('exercice_1 OK')
+    except Exception as e:
+        report.add_malus_note(f"Crash in test_exercice_1: {e}")
+
+
+def exercice_2(module: ModuleType, report: Report) -> None:
+    try:
+        if module.distance(2, 5) == 3 and module.distance(5, 2) == 3:
+            report.add_bonus_note('exercice_2 OK')
+        else:
+            report.add_malus_note("distance(2, 5) should return 3")
+    except Exception as e:
+        report.add_malus_note(f"Crash in test_exercice_2: {e}")
+
+
+def run(module: ModuleType, report: Report) -> None:
+    exercice_1(module, report)
+    exercice_2(module, report)
+'''
+
+SOLUTION = '''def my_list(n):
+    res = []
+    i = 0
+    while i < n:
+        res = res * 1
+        res = [n] * (i + 1)
+        i = i + 1
+    return res
+
+
+def distance(a, b):
+    if a < b:
+        return b - a
+    return a - b
+'''
+CLEAN_SNIPPETS = [
+    'def {name}(n):\n    res = [n]\n    i = 0\n    while i < n:\n        res = res * 2\n'
+    '        i = i + 1\n    return res\n',
+    'def {name}(a, b):\n    if a < b:\n        return b - a\n    return a - b\n',
+    'def {name}(my_list, i):\n    total = 0\n    while i < 10:\n        total = total + my_list[i]\n'
+    '        i = i + 1\n    return int(total)\n',
+    'def {name}(d, k):\n    d[k] = str(k)\n    return d\n',
+]
+FORBIDDEN_SNIPPETS = [
+    'import os\nfrom sys import path\n',
+    'def {name}(n):\n    for i in range(n):\n        print(i)\n        continue\n    return sum([n])\n',
+    'def {name}(l):\n    try:\n        return l[1:2]\n    except Exception:\n        raise ValueError()\n',
+    'def {name}(l):\n    return [x for x in l] + list(x for x in l) + {{x: x for x in l}}\n',
+    'def {name}(l, x):\n    l.append(x)\n    assert x in l\n    return x is None\n',
+    'def {name}(a, b=1, *args, **kwargs):\n    global c\n    return type("A", (), {{}})\n',
+    'class {name}:\n    pass\n',
+    'def {name}(n):\n    while n:\n        break\n    else:\n        n = 1\n    yield n\n',
+    'def len(x):\n    return 0\n',
+]
+INFINITE_LOOP = 'def my_list(n):\n    while True:\n        n = n + 1\n'
+# About 200 MB of list, allocated as the module is executed
+MEMORY_HOG = 'hog = [0] * 25000000\n'
+
+SHAPES = ('clean', 'forbidden', 'huge', 'syntax_error', 'infinite_loop', 'memory_hog')
+DEFAULT_MIX = {'clean': 50, 'forbidden': 30, 'huge': 5, 'syntax_error': 5, 'infinite_loop': 5,
+               'memory_hog': 5}
+
+
+def generate_functions(rng: random.Random, functions: int, forbidden: float) -> str:
+    """
+    Function that returns the source of random functions, a share of them being forbidden
+    """
+    snippets = []
+    for i in range(functions):
+        pool = FORBIDDEN_SNIPPETS if rng.random() < forbidden else CLEAN_SNIPPETS
+        snippets.append(rng.choice(pool).format(name=f'function_{i}'))
+    return '\n\n'.join(snippets)
+
+
+def generate_submission(rng: random.Random, shape: str) -> str:
+    """
+    Function that returns the source of a synthetic submission of the given shape
+    """
+    if shape == 'clean':
+        return SOLUTION + '\n\n' + generate_functions(rng, rng.randint(5, 40), 0.)
+    if shape == 'forbidden':
+        return generate_functions(rng, rng.randint(5, 40), .3) + '\n\n' + SOLUTION
+    if shape == 'huge':
+        return SOLUTION + '\n\n' + generate_functions(rng, 2000, .05)
+    if shape == 'syntax_error':
+        code = SOLUTION + '\n\n' + generate_functions(rng, rng.randint(5, 40), 0.)
+        return code.replace('):\n', ')\n', 1)
+    if shape == 'infinite_loop':
+        return generate_functions(rng, rng.randint(5, 40), 0.) + '\n\n' + INFINITE_LOOP
+    if shape == 'memory_hog':
+        return MEMORY_HOG + SOLUTION
+    raise ValueError(f'Unknown shape: {shape}')
+
+
+def generate_corpus(size: int, seed: int = 0, mix: dict[str, float] | None = None
+                    ) -> list[tuple[str, str]]:
+    """
+    Function that returns a reproducible corpus of (shape, source) synthetic submissions
+    """
+    mix = DEFAULT_MIX if mix is None else mix
+    rng = random.Random(seed)
+    shapes = rng.choices(list(mix), list(mix.values()), k=size)
+    return [(shape, generate_submission(rng, shape)) for shape in shapes]
+
+
+def generate_cohort(folder: Path, size: int, seed: int = 0,
+                    mix: dict[str, float] | None = None) -> Path:
+    """
+    Function that writes a synthetic cohort in the folder, and returns the folder
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / 'moulinette.py').write_text(MOULINETTE, encoding='utf-8')
+    width = len(str(size))
+    for i, (shape, code) in enumerate(generate_corpus(size, seed, mix)):
+        (folder / f'student_{i:0{width}}_{shape}.py').write_text(code, encoding='utf-8')
+    return folder
+
+
+def mix_validator(mix: str) -> dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        shape, _, weight = item.partition('=')
+        if shape not in SHAPES:
+            raise ValueError(f'{shape} is not one of {", ".join(SHAPES)}')
+        weights[shape] = float(weight or 1)
+    return weights
+
+
+def add_cohort_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-n', '--size', type=int, default=200,
+                        help='The number of submissions (default: 200)')
+    parser.add_argument('--mix', type=mix_validator, default=DEFAULT_MIX,
+                        help='The weight of each shape of submission, eg. clean=9,huge=1 '
+                             f'(shapes: {", ".join(SHAPES)})')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic cohort')
+    parser.add_argument('folder', type=Path)
+    add_cohort_arguments(parser)
+    namespace = parser.parse_args()
+    generate_cohort(namespace.folder, namespace.size, namespace.seed, namespace.mix)
+
+
+if __name__ == '__main__':
+    main()
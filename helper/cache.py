@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+from helper.report import Report
+
+HELPER_FOLDER = Path(__file__).resolve().parent
+# Every file that changes how a submission is cleaned, rewritten, executed or scored
+PIPELINE_FILES = ('clean_code.py', 'insert_code.py', 'inserts.py', 'workers.py', 'registry.py')
+DEFAULT_CACHE_FOLDER = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) \
+    / 'student_crusher'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def pipeline_digest() -> str:
+    """
+    Function that returns a digest of the rule set and of the code inserted in submissions
+    """
+    hasher = hashlib.sha256()
+    for name in PIPELINE_FILES:
+        hasher.update((HELPER_FOLDER / name).read_bytes())
+    return hasher.hexdigest()
+
+
+class ReportCache:
+    """
+    Persistent, content-addressed cache of the reports produced by a moulinette
+
+    A report is keyed by the submission source, the moulinette source, the rule set and the
+    timeout and memory limit it ran with, so a hit is always the report a full run would have
+    produced.
+    """
+
+    def __init__(self, moulinette: Path | bytes, folder: Path = DEFAULT_CACHE_FOLDER,
+                 max_size: int = DEFAULT_MAX_SIZE, refresh: bool = False,
+                 timeout: float | None = None, memory_limit: int | None = None):
+        self.folder = folder
+        self.max_size = max_size
+        self.refresh = refresh
+        hasher = hashlib.sha256(pipeline_digest().encode())
+        hasher.update(moulinette if isinstance(moulinette, bytes) else moulinette.read_bytes())
+        hasher.update(json.dumps([timeout, memory_limit]).encode())
+        self._salt = hasher.digest()
+
+    def key(self, source: bytes) -> str:
+        """Returns the cache key of a submission"""
+        return hashlib.sha256(self._salt + source).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f'{key}.json'
+
+    def get(self, key: str, student_name: str) -> Report | None:
+        """Returns the cached report of a submission, or None on a miss"""
+        if self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+            score, entries, usage = data['score'], data['entries'], data['usage']
+            fingerprint = data['fingerprint']
+        except (OSError, ValueError, KeyError):
+            return None
+        # Touch the entry so eviction drops the least recently used ones first
+        path.touch()
+        report = Report(student_name)
+        report.score = score
+        report.entries = [(code if code is None else sys.intern(code), count, detail)
+                          for code, count, detail in entries]
+        report.usage = usage
+        report.fingerprint = fingerprint
+        return report
+
+    def put(self, key: str, report: Report) -> None:
+        """Stores the report of a submission"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps({'score': report.score, 'entries': report.entries,
+                                   'usage': report.usage, 'fingerprint': report.fingerprint}),
+                       encoding='utf-8')
+        os.replace(tmp, path)
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_size"""
+        entries = []
+        for path in self.folder.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,294 @@
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, answer_challenge, \
+    deliver_challenge, wait
+from pathlib import Path
+from typing import Any, Callable, Iterator, NamedTuple
+
+from helper.submissions import MOULINETTE_NAME, moulinette_version, read_moulinette
+from helper.workers import DEFAULT_MEMORY_LIMIT, DEFAULT_TIMEOUT, TaskResult, WorkerPool
+
+# Remote workers send a heartbeat this often, in seconds, and are given up on after this many
+# heartbeats without any message
+HEARTBEAT_INTERVAL = 1.
+HEARTBEAT_MISSES = 5
+# Tasks sent to a remote worker ahead of its free processes, so that they never wait for the
+# network between two tasks
+PREFETCH_PER_PROCESS = 2
+# The secret that the coordinator and its workers authenticate each other with: their messages
+# are pickles, they must not accept connections from anyone else
+AUTHKEY_VARIABLE = 'MOULI_AUTHKEY'
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """
+    Function that returns the (host, port) of a HOST:PORT address, or of a port alone on the
+    loopback interface
+    """
+    host, _, port = address.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise ValueError(f"{address} is not a valid HOST:PORT address") from None
+
+
+def authkey_from_env() -> bytes:
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"set {AUTHKEY_VARIABLE} to the same secret on the coordinator and on "
+                         f"its workers")
+    return authkey.encode()
+
+
+class _Job(NamedTuple):
+    cost: float
+    order: int
+    key: Any
+    func: Callable
+    args: tuple
+    digest: str
+    timeout: float | None
+    static_timeout: float | None
+
+
+class _Remote:
+    def __init__(self, conn: Connection, processes: int, name: str):
+        self.conn = conn
+        self.processes = processes
+        self.name = name
+        self.jobs: dict[int, _Job] = {}
+        self.digests: set[str] = set()
+        self.seen = time.monotonic()
+
+
+class RemotePool:
+    """
+    Coordinator of workers running on other machines, used like a WorkerPool.
+
+    Workers started with serve_worker connect to the address of the pool, possibly after its
+    tasks were submitted. The first argument of every task is the target folder of its
+    moulinette: each worker is sent the moulinettes it has not seen yet, keyed by the digest
+    of their source, and runs the tasks on a WorkerPool of its own, which enforces their
+    timeouts. A worker that disconnects or misses its heartbeats is given up on, and its tasks
+    are queued again for the others: every task gets exactly one result.
+    """
+
+    def __init__(self, address: tuple[str, int], authkey: bytes,
+                 timeout: float | None = DEFAULT_TIMEOUT, heartbeat: float = HEARTBEAT_INTERVAL):
+        self.authkey = authkey
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self._server = socket.create_server(address)
+        self.address = self._server.getsockname()[:2]
+        self._connected: queue.SimpleQueue[_Remote] = queue.SimpleQueue()
+        self._remotes: list[_Remote] = []
+        self._pending: list[tuple[float, int, _Job]] = []
+        self._order = itertools.count()
+        self._moulinettes: dict[str, bytes] = {}
+        self._digests: dict[Path, tuple[tuple[int, ...], str]] = {}
+        self._next_id = 0
+        self._waiting = False
+
+    def __enter__(self) -> 'RemotePool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.terminate()
+
+    def _digest(self, target: Path) -> str:
+        """Returns the digest of the moulinette of a target folder, read again when it changes"""
+        version = moulinette_version(target)
+        cached = self._digests.get(target)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        source = read_moulinette(target)
+        digest = hashlib.sha256(source).hexdigest()
+        self._moulinettes[digest] = source
+        self._digests[target] = (version, digest)
+        return digest
+
+    @property
+    def processes(self) -> int:
+        return sum(remote.processes for remote in self._remotes)
+
+    @property
+    def queued(self) -> int:
+        """The number of tasks waiting to be sent to a worker"""
+        return len(self._pending)
+
+    def submit(self, key: Any, func: Callable, target: Path, *args: Any,
+               timeout: float | None = None, cost: float = 0.,
+               static_timeout: float | None = None) -> None:
+        """
+        Queues func(target, *args), and sends it right away if a worker has room for it, its
+        result will be given back by poll() or results() along with key. The task has the
+        timeout of the pool, unless given its own, and is sent before the queued tasks of lower
+        cost. A static timeout is the one of WorkerPool.submit.
+        """
+        self._queue(_Job(cost, next(self._order), key, func, args, self._digest(target),
+                         self.timeout if timeout is None else timeout, static_timeout))
+        self._accept()
+        self._dispatch()
+
+    def _queue(self, job: _Job) -> None:
+        heapq.heappush(self._pending, (-job.cost, job.order, job))
+
+    def _handshake(self, sock: socket.socket) -> None:
+        # In a thread of its own, so that a slow or hostile client never stalls the results
+        conn = Connection(sock.detach())
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+            if not conn.poll(self.heartbeat * HEARTBEAT_MISSES):
+                raise EOFError
+            kind, processes, name = conn.recv()
+            if kind != 'hello':
+                raise ValueError(kind)
+        except (AuthenticationError, EOFError, OSError, ValueError):
+            conn.close()
+            return
+        self._connected.put(_Remote(conn, processes, name))
+
+    def _accept(self) -> None:
+        while wait([self._server], 0):
+            sock, _ = self._server.accept()
+            threading.Thread(target=self._handshake, args=(sock,), daemon=True).start()
+        while not self._connected.empty():
+            remote = self._connected.get()
+            print(f"Worker {remote.name} connected, {remote.processes} processes")
+            self._remotes.append(remote)
+
+    def _drop(self, remote: _Remote, reason: str) -> None:
+        """Gives up on a worker, and queues its tasks again, in their first place"""
+        remote.conn.close()
+        self._remotes.remove(remote)
+        for job in remote.jobs.values():
+            self._queue(job)
+        print(f"Worker {remote.name} {reason}, {len(remote.jobs)} tasks queued again")
+
+    def _dispatch(self) -> None:
+        for remote in list(self._remotes):
+            try:
+                while self._pending and \
+                        len(remote.jobs) < remote.processes * PREFETCH_PER_PROCESS:
+                    _, _, job = heapq.heappop(self._pending)
+                    remote.jobs[self._next_id] = job
+                    if job.digest not in remote.digests:
+                        remote.conn.send(('moulinette', job.digest,
+                                          self._moulinettes[job.digest]))
+                        remote.digests.add(job.digest)
+                    remote.conn.send(('job', self._next_id, job.digest, job.func, job.args,
+                                      job.timeout, job.static_timeout))
+                    self._next_id += 1
+            except OSError:
+                self._drop(remote, 'disconnected')
+
+    def _receive(self, remote: _Remote) -> Iterator[TaskResult]:
+        remote.seen = time.monotonic()
+        while remote.conn.poll():
+            message = remote.conn.recv()
+            if message[0] == 'result':
+                _, job_id, value, error, timings = message
+                job = remote.jobs.pop(job_id)
+                yield TaskResult(job.key, value, error, timings)
+
+    def results(self) -> Iterator[TaskResult]:
+        """
+        Runs the queued tasks on the connected workers, waiting for one to connect if there is
+        none, and yields their results as soon as each one finishes
+        """
+        while True:
+            self._accept()
+            self._dispatch()
+            if not self._pending and not any(remote.jobs for remote in self._remotes):
+                return
+            yield from self.poll()
+
+    def poll(self, timeout: float | None = None) -> list[TaskResult]:
+        """
+        Sends the queued tasks to the connected workers, waits for one of them to send results,
+        at most timeout seconds and one heartbeat, and returns the results received
+        """
+        self._accept()
+        self._dispatch()
+        if not self._remotes and not self._waiting:
+            print(f"Waiting for workers on {self.address[0]}:{self.address[1]}")
+        self._waiting = not self._remotes
+        ready = wait([self._server] + [remote.conn for remote in self._remotes],
+                     self.heartbeat if timeout is None else min(timeout, self.heartbeat))
+        results = []
+        now = time.monotonic()
+        for remote in list(self._remotes):
+            if remote.conn in ready:
+                try:
+                    # Results received before the connection broke are kept: their tasks are
+                    # not queued again
+                    for result in self._receive(remote):
+                        results.append(result)
+                except (EOFError, OSError):
+                    self._drop(remote, 'disconnected')
+            elif now - remote.seen > self.heartbeat * HEARTBEAT_MISSES:
+                self._drop(remote, 'missed its heartbeats')
+        return results
+
+    def terminate(self) -> None:
+        """Disconnects the workers, which stop, and stops accepting new ones"""
+        self._pending.clear()
+        for remote in self._remotes:
+            remote.conn.close()
+        self._remotes.clear()
+        self._server.close()
+
+
+def serve_worker(address: tuple[str, int], authkey: bytes, processes: int | None = None,
+                 memory_limit: int | None = DEFAULT_MEMORY_LIMIT,
+                 start_method: str | None = None, heartbeat: float = HEARTBEAT_INTERVAL
+                 ) -> None:
+    """
+    Function that connects to a RemotePool, runs its tasks on a WorkerPool until it
+    disconnects, and sends their results back as soon as each one finishes
+    """
+    processes = processes or os.cpu_count()
+    if start_method is None and 'forkserver' in multiprocessing.get_all_start_methods():
+        # Forked processes would inherit the connection to the coordinator, which would not
+        # see it close if this worker dies
+        start_method = 'forkserver'
+    conn = Client(address, authkey=authkey)
+    conn.send(('hello', processes, f'{socket.gethostname()}:{os.getpid()}'))
+    print(f"Connected to {address[0]}:{address[1]}, {processes} processes")
+    with tempfile.TemporaryDirectory(prefix='mouli_') as tmp, \
+            WorkerPool(processes=processes, memory_limit=memory_limit,
+                       start_method=start_method) as p:
+        targets: dict[str, Path] = {}
+        next_heartbeat = time.monotonic()
+        try:
+            while True:
+                while conn.poll():
+                    message = conn.recv()
+                    if message[0] == 'moulinette':
+                        _, digest, source = message
+                        targets[digest] = Path(tmp) / digest
+                        targets[digest].mkdir(exist_ok=True)
+                        (targets[digest] / MOULINETTE_NAME).write_bytes(source)
+                    elif message[0] == 'job':
+                        _, job_id, digest, func, args, timeout, static_timeout = message
+                        p.submit(job_id, func, targets[digest], *args, timeout=timeout,
+                                 static_timeout=static_timeout)
+                for result in p.poll(heartbeat, [conn]):
+                    conn.send(('result', *result))
+                if time.monotonic() >= next_heartbeat:
+                    conn.send(('heartbeat',))
+                    next_heartbeat = time.monotonic() + heartbeat
+        except (EOFError, OSError):
+            print("Disconnected from the coordinator")
+        finally:
+            conn.close()
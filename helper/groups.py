@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from helper.report import Report
+
+
+class SubmissionGroups:
+    """
+    Groups the students of a folder whose submissions have the same fingerprint: the same
+    code once cleaned, up to identifiers, constants, whitespace and comments
+    """
+
+    def __init__(self):
+        self.students: dict[tuple[str, str], list[str]] = {}
+
+    def record(self, report: Report, name: str | None = None, folder: str = '') -> Report:
+        """Records the fingerprint of a report, under the name of its student by default"""
+        if report.fingerprint is not None:
+            self.students.setdefault((folder, report.fingerprint), []).append(
+                report.student_name if name is None else name)
+        return report
+
+    def groups(self) -> list[list[str]]:
+        """Returns the groups of at least two students, largest first"""
+        groups = [sorted(students) for students in self.students.values() if len(students) > 1]
+        return sorted(groups, key=lambda group: (-len(group), group))
+
+    def summary(self) -> str:
+        """Returns a human-readable list of the groups"""
+        groups = self.groups()
+        lines = [f'{len(groups)} groups of similar submissions, '
+                 f'{sum(map(len, groups))} students']
+        lines += [f'  {", ".join(group)}' for group in groups]
+        return '\n'.join(lines)
+
+    def dump(self, path: Path) -> None:
+        """Saves the groups as json"""
+        path.write_text(json.dumps(self.groups(), indent=2), encoding='utf-8')
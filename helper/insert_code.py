@@ -1,8 +1,10 @@
-from _ast import AST, List, Call, Name, Load
-from ast import NodeTransformer, unparse, parse, dump
-from pathlib import Path
+import marshal
+from _ast import AST, List, Call, Name, Load, Tuple, Constant
+from ast import NodeTransformer, unparse, fix_missing_locations
+from functools import cache
+from types import CodeType
 
-from helper import report
+from helper import inserts
 
 
 class ASTInserter(NodeTransformer):
@@ -10,12 +12,26 @@ class ASTInserter(NodeTransformer):
     AST inserter that insert nodes
     """
 
-    def visit_List(self, node: List) -> Call:
-        """Rewrites all occurrences of a list with a call to the custom subclass _list."""
+    def visit_List(self, node: List) -> Call | List:
+        """
+        Rewrites all occurrences of a list with a call to the custom subclass list_.
+
+        Empty lists and lists of constants are built from nothing and from a constant tuple, so
+        that no temporary list is built and copied for them. Lists that are assigned to are left
+        untouched.
+        """
         self.generic_visit(node)
+        if not isinstance(node.ctx, Load):
+            return node
+        if not node.elts:
+            args = []
+        elif all(isinstance(elt, Constant) for elt in node.elts):
+            args = [Tuple(elts=node.elts, ctx=Load())]
+        else:
+            args = [node]
         return Call(
             func=Name(id='list_', ctx=Load()),
-            args=[node],
+            args=args,
             keywords=[])
 
     def visit_Name(self, node: Name) -> Name:
@@ -25,26 +41,58 @@ class ASTInserter(NodeTransformer):
         return node
 
 
-def insert_features(cleaned_node):
-    features_nodes = parse(Path('helper/inserts.py').read_text())
-    # print(dump(features_nodes, indent=4))
-    cleaned_node.body.insert(0, features_nodes.body)
-    return cleaned_node
+@cache
+def prelude() -> dict[str, object]:
+    """
+    Function that returns the names the inserted nodes rely on, loaded once per process.
+
+    The namespace is injected in the globals of every student module before its code runs.
+    """
+    return {name: value for name, value in vars(inserts).items() if not name.startswith('__')}
+
+
+def _insert(cleaned_node: AST) -> AST:
+    inserter = ASTInserter()
+    return inserter.visit(cleaned_node)
 
 
 def ast_insert(cleaned_node: AST) -> str:
     """
-    Function that return the code with inserted nodes
+    Function that return the code with inserted nodes, to run with the prelude in its globals
     """
-    # print(dump(cleaned_node, indent=4))
-    inserter = ASTInserter()
-    augmented_node = inserter.visit(cleaned_node)
-    final_node = insert_features(augmented_node)
-    # print('=' * 80)
-    # print(dump(final_node, indent=4))
+    final_node = _insert(cleaned_node)
     try:
-        # print(unparse(final_node))
         return unparse(final_node)
     except Exception as e:
         print(e)
         return ""
+
+
+def compile_code(cleaned_node: AST, filename: str) -> CodeType | str:
+    """
+    Function that return the code object of the code with inserted nodes, to run with the
+    prelude in its globals.
+
+    Deleting forbidden nodes can leave a tree that does not compile (eg. an empty function
+    body): the code is then returned as source, so that executing it reports the same error
+    as the student would get.
+    """
+    final_node = fix_missing_locations(_insert(cleaned_node))
+    try:
+        return compile(final_node, filename, 'exec')
+    except (SyntaxError, ValueError, TypeError):
+        pass
+    try:
+        return unparse(final_node)
+    except Exception as e:
+        print(e)
+        return ""
+
+
+def ast_compile(cleaned_node: AST, filename: str) -> bytes | str:
+    """
+    Function that return the marshalled code object of the code with inserted nodes, or its
+    source when it does not compile
+    """
+    code = compile_code(cleaned_node, filename)
+    return code if isinstance(code, str) else marshal.dumps(code)
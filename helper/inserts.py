@@ -27,5 +27,6 @@ class list_(list):
         raise Exception("Forbidden use of '*= on a list'")
 
     def __mul__(self, other):
-        return self.__class__(super().__mul__(other))
+        # Repeated in place, so that the product is not copied once more into a list_
+        return list.__imul__(self.__class__(self), other)
 
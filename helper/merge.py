@@ -0,0 +1,125 @@
+import contextlib
+import csv
+import heapq
+import json
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, Sequence
+
+from helper.submissions import submission_names
+
+# Formats of the outputs that can be merged, by suffix, csv otherwise
+MERGE_FORMATS = {'.jsonl': 'jsonl'}
+
+Key = tuple[str, ...]
+
+
+def _checked(path: Path, items: Iterable[tuple[Key, Any]]) -> Iterator[tuple[Key, Any]]:
+    previous = None
+    for key, item in items:
+        if previous is not None and key < previous:
+            raise ValueError(f"{path} is not sorted by student: only the outputs of runs without "
+                             f"--unsorted can be merged")
+        previous = key
+        yield key, item
+
+
+def _csv_rows(path: Path, f: IO) -> tuple[list[str], Iterator[tuple[Key, list[str]]]]:
+    """
+    Function that returns the headers of a csv output, and its (key, row), the key being the
+    folder and the student of the row, or its student when it has no folder column
+    """
+    reader = csv.reader(f, delimiter=';', escapechar='\\')
+    headers = next(reader, None)
+    if headers is None:
+        raise ValueError(f"{path} is empty")
+    columns = 2 if headers[0] == 'Folder' else 1
+    return headers, _checked(path, ((tuple(row[:columns]), row) for row in reader))
+
+
+def _jsonl_lines(path: Path, f: IO) -> Iterator[tuple[Key, str]]:
+    """
+    Function that returns the (key, line) of a jsonl output, the key being the folder and the
+    student of the line
+    """
+    def lines() -> Iterator[tuple[Key, str]]:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                yield (data['folder'], data['student']), line
+
+    return _checked(path, lines())
+
+
+def expected_students(targets: Sequence[Path], width: int) -> list[Key]:
+    """
+    Function that returns the sorted keys of the students of the target folders: their folder
+    and name, or only their name when the outputs have no folder column
+    """
+    if width == 1:
+        if len(targets) > 1:
+            raise ValueError("outputs without a folder column come from a single folder")
+        return sorted((name,) for name in submission_names(targets[0]))
+    return sorted((target.name, name) for target in targets for name in submission_names(target))
+
+
+def merge_sorted(streams: Sequence[Iterable[tuple[Key, Any]]], problems: list[str],
+                 expected: Iterable[Key] | None = None) -> Iterator[Any]:
+    """
+    Function that merges streams of (key, item) sorted by key, and yields their items in order.
+
+    Only the first item of a duplicated key is kept. The duplicated keys, and the sorted
+    expected keys that are missing or that are not expected, are added to the problems.
+    """
+    expected = iter(expected) if expected is not None else None
+    pending = next(expected, None) if expected is not None else None
+    previous = None
+    for key, item in heapq.merge(*streams, key=lambda entry: entry[0]):
+        if key == previous:
+            problems.append(f"Duplicated: {'/'.join(key)}")
+            continue
+        previous = key
+        if expected is not None:
+            while pending is not None and pending < key:
+                problems.append(f"Missing: {'/'.join(pending)}")
+                pending = next(expected, None)
+            if pending == key:
+                pending = next(expected, None)
+            else:
+                problems.append(f"Unexpected: {'/'.join(key)}")
+        yield item
+    while pending is not None:
+        problems.append(f"Missing: {'/'.join(pending)}")
+        pending = next(expected, None)
+
+
+def merge_outputs(inputs: Sequence[Path], output: IO, targets: Sequence[Path] | None = None
+                  ) -> list[str]:
+    """
+    Function that merges the sorted outputs of the shards of a run, csv or jsonl, into the
+    output, and returns the problems found: students duplicated, and when the target folders
+    are given, students missing or unknown.
+
+    The merge is streamed: only a row per input is held in memory.
+    """
+    formats = {MERGE_FORMATS.get(path.suffix, 'csv') for path in inputs}
+    if len(formats) > 1:
+        raise ValueError("the outputs to merge must have the same format")
+    problems = []
+    with contextlib.ExitStack() as stack:
+        files = [stack.enter_context(path.open(newline='')) for path in inputs]
+        if formats == {'jsonl'}:
+            streams = [_jsonl_lines(path, f) for path, f in zip(inputs, files)]
+            expected = expected_students(targets, 2) if targets else None
+            for line in merge_sorted(streams, problems, expected):
+                output.write(line if line.endswith('\n') else line + '\n')
+            return problems
+
+        headers, streams = zip(*(_csv_rows(path, f) for path, f in zip(inputs, files)))
+        if any(other != headers[0] for other in headers):
+            raise ValueError("the outputs to merge must have the same columns")
+        expected = expected_students(targets, 2 if headers[0][0] == 'Folder' else 1) \
+            if targets else None
+        writer = csv.writer(output, delimiter=';', escapechar='\\')
+        writer.writerow(headers[0])
+        writer.writerows(merge_sorted(streams, problems, expected))
+    return problems
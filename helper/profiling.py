@@ -0,0 +1,182 @@
+# The C part of tracemalloc: the tracemalloc module itself imports pickle, fnmatch, linecache...
+import _tracemalloc
+import json
+import math
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+from helper.report import Report
+
+# The phases a submission goes through, in order, static being the static analysis done by the
+# parent when the worker of the submission failed
+PHASES = ('read', 'cache', 'clean', 'compile', 'queue', 'send', 'worker', 'exec', 'moulinette',
+          'static')
+# Phases spent inside the worker phase of a submission that has one, not counted twice in its
+# total
+NESTED_PHASES = frozenset({'clean', 'compile', 'exec', 'moulinette'})
+
+
+@contextmanager
+def timed(timings: dict[str, float], phase: str) -> Iterator[None]:
+    """
+    Context manager that adds the time spent in its block to the timings of the phase
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.) + time.perf_counter() - start
+
+
+_PAGE_KIB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+
+def _rss() -> int:
+    """Returns the current RSS of the process in KiB, or 0 where /proc is not available"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_KIB
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@contextmanager
+def measured(usage: dict[str, float]) -> Iterator[None]:
+    """
+    Context manager that adds the resources used in its block to the usage: CPU user and
+    system time in seconds, growth of the RSS of the process in KiB, at its peak or at the end
+    of the block when it already peaked higher before, and allocated blocks still alive at its
+    end. The peak of traced memory in KiB is also measured when
+    tracemalloc is tracing, eg. with PYTHONTRACEMALLOC=1.
+    """
+    times = os.times()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    rss = _rss()
+    blocks = sys.getallocatedblocks()
+    tracing = _tracemalloc.is_tracing()
+    if tracing:
+        _tracemalloc.reset_peak()
+        traced, _ = _tracemalloc.get_traced_memory()
+    try:
+        yield
+    finally:
+        end = os.times()
+        usage['cpu_user'] = usage.get('cpu_user', 0.) + end.user - times.user
+        usage['cpu_system'] = usage.get('cpu_system', 0.) + end.system - times.system
+        growth = _rss() - rss
+        if resource is not None:
+            growth = max(growth, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_rss)
+        usage['peak_rss'] = max(usage.get('peak_rss', 0), growth)
+        usage['blocks'] = usage.get('blocks', 0) + sys.getallocatedblocks() - blocks
+        if tracing:
+            _, peak = _tracemalloc.get_traced_memory()
+            usage['traced_peak'] = max(usage.get('traced_peak', 0), (peak - traced) // 1024)
+
+
+def merge_usage(usage: dict[str, float], other: dict[str, float]) -> None:
+    """
+    Function that adds the usage of another block to the usage, as if measured in the same one
+    """
+    for name, value in other.items():
+        if name in ('peak_rss', 'traced_peak'):
+            usage[name] = max(usage.get(name, 0), value)
+        else:
+            usage[name] = usage.get(name, 0) + value
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Function that returns the nearest-rank percentile q of sorted values
+    """
+    if not values:
+        return 0.
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+class Profile:
+    """
+    Collects the timings of every report, and summarizes them per phase and per student
+    """
+
+    def __init__(self):
+        self.timings: dict[str, dict[str, float]] = {}
+        self.start = time.perf_counter()
+        self.first = None
+        self.wall = 0.
+
+    def record(self, report: Report, name: str | None = None) -> Report:
+        """Records the timings of a report, under the name of its student by default"""
+        self.timings[report.student_name if name is None else name] = dict(report.timings)
+        self.wall = time.perf_counter() - self.start
+        if self.first is None:
+            self.first = self.wall
+        return report
+
+    def phases(self) -> dict[str, dict[str, float]]:
+        """Returns the statistics of each phase: count, total, percentiles and max, in seconds"""
+        names = [phase for phase in PHASES
+                 if any(phase in timings for timings in self.timings.values())]
+        stats = {}
+        for phase in names:
+            values = sorted(timings[phase] for timings in self.timings.values()
+                            if phase in timings)
+            stats[phase] = {
+                'count': len(values),
+                'total': sum(values),
+                'p50': percentile(values, 50),
+                'p90': percentile(values, 90),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+        return stats
+
+    def totals(self) -> dict[str, float]:
+        """Returns the total time spent on each submission"""
+        return {student: sum(seconds for phase, seconds in timings.items()
+                             if phase not in NESTED_PHASES or 'worker' not in timings)
+                for student, timings in self.timings.items()}
+
+    def slowest(self, top: int) -> list[tuple[str, str, float]]:
+        """Returns the top slowest (student, phase, seconds)"""
+        entries = [(student, phase, seconds)
+                   for student, timings in self.timings.items()
+                   for phase, seconds in timings.items()]
+        return sorted(entries, key=lambda entry: entry[2], reverse=True)[:top]
+
+    def summary(self, top: int = 10) -> str:
+        """Returns a human-readable summary of the profile"""
+        lines = [f'{len(self.timings)} submissions in {self.wall:.3f} s, first result after '
+                 f'{self.first or 0.:.3f} s',
+                 f'{"phase":<12}{"count":>7}'
+                 + ''.join(f'{key:>12}' for key in ('total', 'p50', 'p90', 'p99', 'max'))]
+        for phase, stats in self.phases().items():
+            lines.append(f'{phase:<12}{stats["count"]:>7}'
+                         + ''.join(f'{stats[key] * 1000:>10.1f}ms'
+                                   for key in ('total', 'p50', 'p90', 'p99', 'max')))
+        totals = sorted(self.totals().items(), key=lambda item: item[1], reverse=True)
+        lines.append('Slowest students:')
+        for student, total in totals[:top]:
+            lines.append(f'  {student}: {total * 1000:.1f}ms')
+        lines.append('Slowest phases:')
+        for student, phase, seconds in self.slowest(top):
+            lines.append(f'  {student} {phase}: {seconds * 1000:.1f}ms')
+        return '\n'.join(lines)
+
+    def dump(self, path: Path) -> None:
+        """Saves the profile as json"""
+        path.write_text(json.dumps({
+            'wall': self.wall,
+            'first': self.first,
+            'phases': self.phases(),
+            'totals': self.totals(),
+            'students': self.timings,
+        }, indent=2), encoding='utf-8')
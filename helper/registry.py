@@ -0,0 +1,82 @@
+from types import ModuleType
+from typing import Any, Callable, Iterator, NamedTuple
+
+from helper.report import Report
+
+# Called with the module, its report and the fixtures of the moulinette, if it has any
+TestFunction = Callable[..., None]
+
+
+class Test(NamedTuple):
+    """A test of a moulinette, with its own timeout, the pool timeout if None, and weight"""
+    __test__ = False  # not a pytest test class
+    name: str
+    func: TestFunction
+    timeout: float | None = None
+    weight: float = 1
+
+
+class TestRegistry:
+    """
+    Named tests of a moulinette, graded as independent tasks
+
+    A moulinette exposing a registry as its `tests` attribute has each of its tests run in a
+    task of its own, so that a slow or looping test only costs its own score:
+
+        tests = TestRegistry()
+
+        @tests.test(timeout=2., weight=2)
+        def exercice_1(module, report):
+            ...
+
+        run = tests.run
+    """
+    __test__ = False  # not a pytest test class
+
+    def __init__(self):
+        self._tests: dict[str, Test] = {}
+
+    def test(self, timeout: float | None = None, weight: float = 1, name: str | None = None
+             ) -> Callable[[TestFunction], TestFunction]:
+        """Decorator that registers a test, under the name of its function by default"""
+        def register(func: TestFunction) -> TestFunction:
+            test_name = func.__name__ if name is None else name
+            self._tests[test_name] = Test(test_name, func, timeout, weight)
+            return func
+        return register
+
+    def __iter__(self) -> Iterator[Test]:
+        return iter(self._tests.values())
+
+    def __len__(self) -> int:
+        return len(self._tests)
+
+    def __getitem__(self, name: str) -> Test:
+        return self._tests[name]
+
+    def run(self, module: ModuleType, report: Report, *fixtures: Any) -> None:
+        """Runs every test, one after the other, as a moulinette run function"""
+        for test in self:
+            test_report = Report(report.student_name)
+            try:
+                test.func(module, test_report, *fixtures)
+            except Exception as e:
+                test_report.add_note(f"Error: {e}")
+            add_test_report(report, test, test_report)
+
+
+def add_test_report(report: Report, test: Test, test_report: Report) -> None:
+    """
+    Function that adds the notes of a test to the report, and its score times its weight
+    """
+    report.entries.extend(test_report.entries)
+    report.score += test_report.score * test.weight
+
+
+def tests_of(moulinette: ModuleType) -> TestRegistry | None:
+    """
+    Function that returns the test registry of a moulinette, or None if it only has a run
+    function
+    """
+    tests = getattr(moulinette, 'tests', None)
+    return tests if isinstance(tests, TestRegistry) and len(tests) else None
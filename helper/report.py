@@ -1,14 +1,63 @@
+import sys
+from collections.abc import MutableSequence
+
+# Message of each violation code, registered by the rules that report them
+VIOLATION_MESSAGES: dict[str, str] = {}
+
+
+def register_violation(code: str, message: str) -> str:
+    """
+    Function that registers the message of a violation code, and returns the interned code
+    """
+    code = sys.intern(code)
+    VIOLATION_MESSAGES[code] = message
+    return code
+
+
 class Report:
+    """
+    Score and notes of a student.
+
+    Notes are stored as (code, count, detail) entries: rule violations only keep their code,
+    free notes have no code and their text as detail. The text of the notes is only built
+    when they are read.
+    """
+    __slots__ = ('student_name', 'score', 'entries', 'timings', 'usage', 'fingerprint')
+
     def __init__(self, student_name):
         self.student_name = student_name
         self.score = 0
-        self.notes = []
+        self.entries = []
+        self.timings = {}
+        # Resources used running the submission, see helper.profiling.measured
+        self.usage = {}
+        # Digest of the cleaned tree with identifiers and constants normalized, see ast_clean
+        self.fingerprint = None
 
     def __str__(self):
-        return f'{self.__class__.__name__}: ({", ".join((str(v) for v in self.__dict__.values()))})'
+        values = ', '.join(str(getattr(self, name)) for name in self.__slots__)
+        return f'{self.__class__.__name__}: ({values})'
+
+    def __reduce__(self):
+        return _restore, (self.student_name, self.score, self.entries, self.timings, self.usage,
+                          self.fingerprint)
+
+    @property
+    def notes(self) -> 'Notes':
+        """The text of the notes, built from the entries, as a list that edits them"""
+        return Notes(self.entries)
+
+    @notes.setter
+    def notes(self, notes: list[str]) -> None:
+        self.entries = [(None, 0, note) for note in notes]
+
+    def renamed(self, student_name: str) -> 'Report':
+        """Returns a copy of the report for another student, without its timings"""
+        return _restore(student_name, self.score, list(self.entries), {}, dict(self.usage),
+                        self.fingerprint)
 
     def add_note(self, note):
-        self.notes.append(note)
+        self.entries.append((None, 0, note))
 
     def bonus(self, score):
         self.score += score
@@ -17,10 +66,76 @@ class Report:
         self.score -= score
 
     def add_bonus_note(self, note: str, score: int = 1):
-        self.notes.append(note)
+        self.entries.append((None, 0, note))
         self.score += score
 
     def add_malus_note(self, note: str, score: int = 1):
-        self.notes.append(note)
+        self.entries.append((None, 0, note))
         self.score -= score
 
+    def add_violation(self, code: str, count: int, detail: str | None = None,
+                      score: int | None = None):
+        """Adds the note of a rule violation, and a malus of count by default"""
+        self.entries.append((code, count, detail))
+        self.score -= count if score is None else score
+
+
+class Notes(MutableSequence):
+    """
+    The text of the notes of a report, as a list: the notes added, replaced or deleted through
+    it are free notes of its entries
+    """
+    __slots__ = ('entries',)
+
+    def __init__(self, entries: list):
+        self.entries = entries
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [render_entry(*entry) for entry in self.entries[index]]
+        return render_entry(*self.entries[index])
+
+    def __setitem__(self, index, note):
+        if isinstance(index, slice):
+            self.entries[index] = [(None, 0, text) for text in note]
+        else:
+            self.entries[index] = (None, 0, note)
+
+    def __delitem__(self, index):
+        del self.entries[index]
+
+    def __iter__(self):
+        return (render_entry(*entry) for entry in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def insert(self, index, note):
+        self.entries.insert(index, (None, 0, note))
+
+    def __eq__(self, other):
+        return list(self) == (list(other) if isinstance(other, (Notes, list)) else other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def render_entry(code: str | None, count: int, detail: str | None) -> str:
+    """
+    Function that returns the text of a note entry
+    """
+    if code is None:
+        return detail
+    return f'{VIOLATION_MESSAGES[code]}: {count if detail is None else detail}'
+
+
+def _restore(student_name, score, entries, timings, usage, fingerprint) -> Report:
+    report = Report.__new__(Report)
+    report.student_name = student_name
+    report.score = score
+    report.entries = [(code if code is None else sys.intern(code), count, detail)
+                      for code, count, detail in entries]
+    report.timings = timings
+    report.usage = usage
+    report.fingerprint = fingerprint
+    return report
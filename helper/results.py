@@ -0,0 +1,178 @@
+import csv
+import json
+from array import array
+from collections import Counter
+from contextlib import closing
+from pathlib import Path
+from typing import IO, Iterator
+
+from helper.report import Report, render_entry
+
+# Output suffixes exported from a result store instead of streamed as a csv
+EXPORT_FORMATS = {'.jsonl': 'jsonl', '.sqlite': 'sqlite', '.db': 'sqlite'}
+
+_SCHEMA = """
+DROP TABLE IF EXISTS entries;
+DROP TABLE IF EXISTS students;
+CREATE TABLE students (id INTEGER PRIMARY KEY, folder TEXT, student TEXT, score REAL);
+CREATE TABLE entries (student_id INTEGER REFERENCES students(id), position INTEGER,
+                      rule TEXT, count INTEGER, note TEXT);
+"""
+_INDEXES = """
+CREATE INDEX students_student ON students(student);
+CREATE INDEX entries_rule ON entries(rule);
+CREATE INDEX entries_student ON entries(student_id);
+"""
+
+
+def _number(value: float) -> int | float:
+    return int(value) if value.is_integer() else value
+
+
+class ResultStore:
+    """
+    Columnar store of the reports of a cohort
+
+    Scores are kept in an array with a row per student, and the note entries of every
+    report in parallel arrays with a row per entry, so that aggregates over the cohort never
+    go through the text of the notes.
+    """
+
+    def __init__(self):
+        self.folders: list[str] = []
+        self.students: list[str] = []
+        self.scores = array('d')
+        # The entries of student i are the rows offsets[i]:offsets[i + 1] of the entry columns
+        self.offsets = array('q', [0])
+        self.entry_students = array('q')
+        self.entry_rules = array('q')  # index in rules, -1 for free notes
+        self.entry_counts = array('q')
+        self.entry_details: list[str | None] = []
+        self.rules: list[str] = []
+        self._rule_ids: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.students)
+
+    def add(self, report: Report, folder: str = '') -> Report:
+        """Stores a report, and returns it"""
+        row = len(self.students)
+        self.folders.append(folder)
+        self.students.append(report.student_name)
+        self.scores.append(report.score)
+        for code, count, detail in report.entries:
+            if code is None:
+                rule = -1
+            elif (rule := self._rule_ids.get(code)) is None:
+                rule = self._rule_ids[code] = len(self.rules)
+                self.rules.append(code)
+            self.entry_students.append(row)
+            self.entry_rules.append(rule)
+            self.entry_counts.append(count)
+            self.entry_details.append(detail)
+        self.offsets.append(len(self.entry_rules))
+        return report
+
+    def _entries(self, row: int) -> Iterator[tuple[str | None, int, str | None]]:
+        for i in range(self.offsets[row], self.offsets[row + 1]):
+            rule = self.entry_rules[i]
+            yield (None if rule < 0 else self.rules[rule]), self.entry_counts[i], \
+                self.entry_details[i]
+
+    def report(self, row: int) -> Report:
+        """Returns the report of a row"""
+        report = Report(self.students[row])
+        report.score = _number(self.scores[row])
+        report.entries = list(self._entries(row))
+        return report
+
+    def rows(self, sort: bool = True) -> list[int]:
+        """Returns the rows sorted by folder and student, or in insertion order"""
+        rows = range(len(self.students))
+        if not sort:
+            return list(rows)
+        return sorted(rows, key=lambda row: (self.folders[row], self.students[row]))
+
+    def students_with(self, code: str) -> int:
+        """Returns the number of students who broke a rule"""
+        rule = self._rule_ids.get(code)
+        if rule is None:
+            return 0
+        return len({student for student, entry_rule in zip(self.entry_students, self.entry_rules)
+                    if entry_rule == rule})
+
+    def rule_counts(self) -> dict[str, tuple[int, int]]:
+        """Returns the number of students who broke each rule, and how many times in total"""
+        students = [set() for _ in self.rules]
+        totals = [0] * len(self.rules)
+        for student, rule, count in zip(self.entry_students, self.entry_rules,
+                                        self.entry_counts):
+            if rule >= 0:
+                students[rule].add(student)
+                totals[rule] += count
+        return {code: (len(students[rule]), totals[rule]) for rule, code in enumerate(self.rules)}
+
+    def score_histogram(self) -> dict[int | float, int]:
+        """Returns the number of students with each score, by increasing score"""
+        return {_number(score): n for score, n in sorted(Counter(self.scores).items())}
+
+    def summary(self) -> str:
+        """Returns the score histogram and the rules broken by the most students"""
+        lines = [f'{len(self)} students, mean score '
+                 f'{sum(self.scores) / len(self) if len(self) else 0:.2f}', '',
+                 f'{"Score":>8} {"Students":>8}']
+        lines += [f'{score:>8} {n:>8}' for score, n in self.score_histogram().items()]
+        counts = sorted(self.rule_counts().items(), key=lambda item: (-item[1][0], item[0]))
+        if counts:
+            lines += ['', f'{"Rule":<16} {"Students":>8} {"Total":>8}']
+            lines += [f'{code:<16} {students:>8} {total:>8}'
+                      for code, (students, total) in counts]
+        return '\n'.join(lines)
+
+    def to_csv(self, output: IO, sort: bool = True) -> None:
+        """Writes the reports as a csv, with the folder of each report"""
+        writer = csv.writer(output, delimiter=';', escapechar='\\')
+        writer.writerow(['Folder', 'Student', 'Grade', 'Comment'])
+        for row in self.rows(sort):
+            notes = ', '.join(render_entry(*entry) for entry in self._entries(row))
+            writer.writerow([self.folders[row], self.students[row], _number(self.scores[row]),
+                             notes])
+
+    def to_jsonl(self, output: IO, sort: bool = True) -> None:
+        """Writes a json object per report, with its violations and the text of its notes"""
+        for row in self.rows(sort):
+            entries = list(self._entries(row))
+            output.write(json.dumps({
+                'folder': self.folders[row],
+                'student': self.students[row],
+                'score': _number(self.scores[row]),
+                'violations': {code: count for code, count, _ in entries if code is not None},
+                'notes': [render_entry(*entry) for entry in entries],
+            }) + '\n')
+
+    def to_sqlite(self, path: Path, sort: bool = True) -> None:
+        """Writes the reports in the students and entries tables of a sqlite database"""
+        import sqlite3  # slow to import, only needed by this export
+
+        rows = self.rows(sort)
+        with closing(sqlite3.connect(path)) as db, db:
+            db.executescript(_SCHEMA)
+            db.executemany('INSERT INTO students VALUES (?, ?, ?, ?)',
+                           ((row, self.folders[row], self.students[row], self.scores[row])
+                            for row in rows))
+            db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                           ((row, position, code, count, render_entry(code, count, detail))
+                            for row in rows
+                            for position, (code, count, detail)
+                            in enumerate(self._entries(row))))
+            db.executescript(_INDEXES)
+
+    def export(self, path: Path, sort: bool = True) -> None:
+        """Writes the reports in the format of the suffix of the file, csv by default"""
+        export_format = EXPORT_FORMATS.get(path.suffix, 'csv')
+        if export_format == 'sqlite':
+            path.unlink(missing_ok=True)
+            self.to_sqlite(path, sort)
+            return
+        with path.open('w', newline='') as f:
+            (self.to_jsonl if export_format == 'jsonl' else self.to_csv)(f, sort)
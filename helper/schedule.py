@@ -0,0 +1,102 @@
+import heapq
+import json
+import os
+import time
+from pathlib import Path
+
+from helper.report import Report
+
+HISTORY_NAME = 'history.json'
+# Seconds per byte of submission, until a run measured it
+DEFAULT_SECONDS_PER_BYTE = 1e-5
+
+
+def list_makespan(durations: list[float], workers: int) -> float:
+    """
+    Function that returns the makespan of tasks of the given durations, each one started in
+    order on the first free worker
+    """
+    ends = [0.] * max(1, workers)
+    for duration in durations:
+        heapq.heappush(ends, heapq.heappop(ends) + duration)
+    return max(ends)
+
+
+class Scheduler:
+    """
+    Expected cost of the submissions of a run, to grade the slowest ones first.
+
+    A submission is expected to take the worker time its student took in the previous runs of
+    its folder, kept in a history file, or else its size converted to seconds by the ratio
+    measured in the previous runs: the size is known before the submission is read, and the
+    parent never parses it. Longest expected first keeps a slow submission from being started
+    last, while the others fill the remaining workers around it.
+    """
+
+    def __init__(self, history: Path | None = None):
+        self.path = history
+        self.history: dict[str, dict[str, float]] = {}
+        self.seconds_per_byte = DEFAULT_SECONDS_PER_BYTE
+        if history is not None:
+            try:
+                data = json.loads(history.read_text(encoding='utf-8'))
+                self.history = data['folders']
+                self.seconds_per_byte = data['seconds_per_byte']
+            except (OSError, ValueError, KeyError):
+                pass
+        # Students, by folder, in the order their submissions were listed, and what they cost
+        self.order: list[tuple[str, str]] = []
+        self.expected: dict[tuple[str, str], float] = {}
+        self.sizes: dict[tuple[str, str], int] = {}
+        self.durations: dict[tuple[str, str], float] = {}
+        self.start = self.end = None
+
+    def cost(self, target: Path, student: str, size: int) -> float:
+        """Returns the expected worker time of a submission of size bytes, in seconds"""
+        if self.start is None:
+            self.start = time.perf_counter()
+        key = (str(target), student)
+        self.order.append(key)
+        seconds = self.history.get(key[0], {}).get(student)
+        if seconds is None:
+            self.sizes[key] = size
+            seconds = size * self.seconds_per_byte
+        self.expected[key] = seconds
+        return seconds
+
+    def record(self, target: Path, report: Report) -> Report:
+        """Records the worker time of a report, if it ran"""
+        key = (str(target), report.student_name)
+        if key in self.expected and 'worker' in report.timings:
+            self.durations[key] = report.timings['worker']
+            self.end = time.perf_counter()
+        return report
+
+    def save(self) -> None:
+        """Adds the worker times of this run to the history file"""
+        if self.path is None or not self.durations:
+            return
+        for (folder, student), seconds in self.durations.items():
+            self.history.setdefault(folder, {})[student] = seconds
+        measured = [key for key in self.sizes if key in self.durations and self.sizes[key]]
+        if measured:
+            self.seconds_per_byte = sum(self.durations[key] for key in measured) \
+                / sum(self.sizes[key] for key in measured)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps({'seconds_per_byte': self.seconds_per_byte,
+                                   'folders': self.history}), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+    def summary(self, workers: int) -> str:
+        """
+        Returns the makespan of the run, along with the makespans of its worker times run in
+        order of expected cost and in the order the submissions were listed
+        """
+        listed = [self.durations[key] for key in self.order if key in self.durations]
+        expected = [self.durations[key] for key in sorted(
+            self.order, key=lambda key: self.expected[key], reverse=True)
+            if key in self.durations]
+        return (f'Makespan {self.end - self.start:.3f} s on {workers} workers, simulated '
+                f'{list_makespan(expected, workers):.3f} s slowest first, '
+                f'{list_makespan(listed, workers):.3f} s in listing order')
@@ -0,0 +1,209 @@
+import hashlib
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Callable, Iterator, NamedTuple
+
+MOULINETTE_NAME = 'moulinette.py'
+# Archives graded like folders, without extracting them
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+# Submissions larger than this, in bytes, are rejected before being read
+DEFAULT_MAX_SIZE = 1024 * 1024
+
+
+class SubmissionTooLarge(ValueError):
+    pass
+
+
+class ArchiveMember(NamedTuple):
+    """
+    A submission inside an archive, with its content, None when it is over the size limit, and
+    the folder of the archive its student is named from
+    """
+    archive: Path
+    member: str
+    size: int
+    data: bytes | None = None
+    root: PurePosixPath = PurePosixPath()
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.member).name
+
+    @property
+    def stem(self) -> str:
+        return _member_student(self.member, self.root)
+
+    def read_bytes(self) -> bytes:
+        if self.data is None:
+            raise SubmissionTooLarge(f"{self.member} was not read from {self.archive}")
+        return self.data
+
+
+Submission = Path | ArchiveMember
+
+
+def is_archive(target: Path) -> bool:
+    """
+    Function that checks if a target is an archive of submissions rather than a folder
+    """
+    return target.name.endswith(ARCHIVE_SUFFIXES) and target.is_file()
+
+
+def is_submission(file: Path) -> bool:
+    """
+    Function that checks if a file of a target folder is a submission to grade
+    """
+    return file.suffix == '.py' and file.name != MOULINETTE_NAME and file.is_file()
+
+
+def _is_member_submission(member: str) -> bool:
+    path = PurePosixPath(member)
+    # Hidden files are the resource forks and editor files that archivers pick up
+    return path.suffix == '.py' and path.name != MOULINETTE_NAME \
+        and not path.name.startswith('.')
+
+
+def _archive_files(archive: Path) -> Iterator[tuple[str, int, Callable[[], bytes]]]:
+    """
+    Function that yields the (name, size, read function) of the files of an archive, in the
+    order they are stored. Tar archives are read as a stream: a file can only be read before
+    the next one is yielded.
+    """
+    if archive.name.endswith('.zip'):
+        with zipfile.ZipFile(archive) as f:
+            for info in f.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, lambda info=info: f.read(info)
+        return
+    with tarfile.open(archive, 'r|*') as f:
+        for info in f:
+            if info.isfile():
+                yield info.name, info.size, lambda info=info: f.extractfile(info).read()
+
+
+def archive_root(archive: Path) -> PurePosixPath:
+    """
+    Function that returns the folder of an archive its students are named from: the folder of
+    its moulinette, at the root of the archive or of its top folder, or else the top folder of
+    every submission if they share one
+    """
+    tops = set()
+    for member, _, _ in _archive_files(archive):
+        path = PurePosixPath(member)
+        if path.name == MOULINETTE_NAME and len(path.parts) <= 2:
+            return path.parent
+        if _is_member_submission(member):
+            tops.add(path.parts[0] if len(path.parts) > 1 else None)
+    return PurePosixPath(tops.pop()) if len(tops) == 1 and None not in tops else PurePosixPath()
+
+
+def _member_student(member: str, root: PurePosixPath) -> str:
+    """
+    Function that returns the student of an archive member: its path from the root folder
+    without its suffix, so that the files of per-student folders do not share a name
+    """
+    path = PurePosixPath(member)
+    if path.is_relative_to(root):
+        path = path.relative_to(root)
+    return str(path.with_suffix(''))
+
+
+def in_shard(student: str, shard: tuple[int, int] | None) -> bool:
+    """
+    Function that checks if a student is in the shard (i, n), the i-th of n, from 1 to n, from a
+    hash of their name alone: the same on every machine, run and folder
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.blake2b(student.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count == index - 1
+
+
+def iter_submissions(target: Path, max_size: int | None = DEFAULT_MAX_SIZE,
+                     shard: tuple[int, int] | None = None) -> Iterator[Submission]:
+    """
+    Function that yields the submissions of a target folder, or of an archive as they are read
+    from it, leaving out the content of the members over max_size bytes, and only the ones of
+    the shard if given
+    """
+    if not is_archive(target):
+        yield from (file for file in target.iterdir()
+                    if is_submission(file) and in_shard(file.stem, shard))
+        return
+    root = archive_root(target)
+    for member, size, read in _archive_files(target):
+        if _is_member_submission(member) and in_shard(_member_student(member, root), shard):
+            yield ArchiveMember(target, member, size,
+                                read() if max_size is None or size <= max_size else None, root)
+
+
+def list_submissions(target: Path, max_size: int | None = DEFAULT_MAX_SIZE,
+                     shard: tuple[int, int] | None = None) -> list[Submission]:
+    """
+    Function that returns the submissions of a target folder or archive
+    """
+    return list(iter_submissions(target, max_size, shard))
+
+
+def submission_names(target: Path) -> list[str]:
+    """
+    Function that returns the students of a target folder or archive, without reading their
+    submissions
+    """
+    if not is_archive(target):
+        return [file.stem for file in target.iterdir() if is_submission(file)]
+    root = archive_root(target)
+    return [_member_student(member, root) for member, _, _ in _archive_files(target)
+            if _is_member_submission(member)]
+
+
+def submission_size(file: Submission) -> int:
+    """
+    Function that returns the size of a submission in bytes, without reading it
+    """
+    return file.size if isinstance(file, ArchiveMember) else file.stat().st_size
+
+
+def read_submission(file: Submission, max_size: int | None = DEFAULT_MAX_SIZE) -> bytes:
+    """
+    Function that returns the content of a submission, checking its size before reading it
+    """
+    size = submission_size(file)
+    if max_size is not None and size > max_size:
+        raise SubmissionTooLarge(f"Submission too large: {size // 1024} KiB, "
+                                 f"limit {max_size // 1024} KiB")
+    return file.read_bytes()
+
+
+def read_moulinette(target: Path) -> bytes:
+    """
+    Function that returns the source of the moulinette of a target folder, or of an archive:
+    at the root of the archive or of its top folder, or else next to it
+    """
+    if not is_archive(target):
+        return (target / MOULINETTE_NAME).read_bytes()
+    for member, _, read in _archive_files(target):
+        path = PurePosixPath(member)
+        if path.name == MOULINETTE_NAME and len(path.parts) <= 2:
+            return read()
+    path = target.parent / MOULINETTE_NAME
+    if not path.is_file():
+        raise FileNotFoundError(f"no {MOULINETTE_NAME} in {target} nor next to it")
+    return path.read_bytes()
+
+
+def moulinette_version(target: Path) -> tuple[int, ...]:
+    """
+    Function that returns the modification times and sizes of the files the moulinette of a
+    target is read from, which change along with it
+    """
+    paths = [target, target.parent / MOULINETTE_NAME] if is_archive(target) \
+        else [target / MOULINETTE_NAME]
+    version = ()
+    for path in paths:
+        if path.is_file():
+            stat = path.stat()
+            version += (stat.st_mtime_ns, stat.st_size)
+    return version
@@ -0,0 +1,65 @@
+import hashlib
+from pathlib import Path
+from typing import NamedTuple
+
+from helper.submissions import MOULINETTE_NAME, list_submissions
+
+
+class Changes(NamedTuple):
+    """The submissions added, modified or deleted since the last poll"""
+    modified: list[Path]
+    deleted: list[Path]
+    moulinette: bool
+
+
+class FolderWatcher:
+    """
+    Polls a target folder for changes, without any external dependency.
+
+    A file is only read when its modification time or its size changed, and only counts as
+    modified when its content did.
+    """
+
+    def __init__(self, target: Path):
+        self.target = target
+        self._files: dict[Path, tuple[int, int, str]] = {}
+        self._moulinette: tuple[int, int, str] | None = None
+
+    def _state(self, file: Path, previous: tuple[int, int, str] | None
+               ) -> tuple[int, int, str] | None:
+        try:
+            stat = file.stat()
+        except FileNotFoundError:
+            return None
+        if previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+            return previous
+        try:
+            digest = hashlib.sha256(file.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, digest
+
+    def poll(self) -> Changes:
+        """Returns the changes since the last poll, every submission counting as new at first"""
+        moulinette = self._state(self.target / MOULINETTE_NAME, self._moulinette)
+        moulinette_changed = self._moulinette is not None \
+            and (moulinette is None or moulinette[2] != self._moulinette[2])
+        self._moulinette = moulinette
+
+        modified = []
+        files = {}
+        for file in list_submissions(self.target):
+            previous = self._files.get(file)
+            state = self._state(file, previous)
+            if state is None:
+                continue
+            files[file] = state
+            if previous is None or previous[2] != state[2]:
+                modified.append(file)
+        deleted = [file for file in self._files if file not in files]
+        self._files = files
+        return Changes(modified, deleted, moulinette_changed)
+
+    def files(self) -> list[Path]:
+        """Returns the submissions seen by the last poll"""
+        return list(self._files)
@@ -0,0 +1,571 @@
+import collections
+import heapq
+import importlib.util
+import itertools
+import marshal
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from functools import cache
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from collections.abc import Mapping
+from types import CodeType, ModuleType
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+try:
+    import resource
+except ImportError:  # Windows: neither CPU time nor address space limits
+    resource = None
+
+from helper.clean_code import ast_clean
+from helper.insert_code import compile_code, prelude
+from helper.profiling import measured, timed
+from helper.registry import tests_of
+from helper.report import Report
+from helper.submissions import MOULINETTE_NAME, is_archive, moulinette_version, read_moulinette
+
+# Workers are replaced after this many submissions, so that state leaked by student code
+# (patched builtins, huge globals, ...) cannot pile up
+MAX_TASKS_PER_WORKER = 100
+DEFAULT_TIMEOUT = 1.
+DEFAULT_MEMORY_LIMIT = 2 * 1024 ** 3
+# Compiled submissions a worker keeps for the tests of their submission still to run
+CODES_PER_WORKER = 4
+
+# Modules a forkserver imports once, so that the workers it forks start with them loaded
+PRELOADED_MODULES = ['helper.workers']
+# The time a worker may spend cleaning and compiling a submission, before its own timeout starts
+STATIC_TIMEOUT = 10.
+
+_codes: collections.OrderedDict[bytes | str, CodeType | str] = collections.OrderedDict()
+# The fixtures of each version of the moulinette of a target
+_fixtures: dict[tuple[Path, tuple[int, ...]], tuple] = {}
+# The connection and the timeout of the task a worker runs, until it starts its deadline
+_deadline: tuple[Connection, float | None] | None = None
+
+
+@cache
+def extract_module_from_path(name: str, path: Path, version: Any = None) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@cache
+def extract_module_from_archive(name: str, archive: Path, version: Any = None) -> ModuleType:
+    spec = importlib.util.spec_from_loader(name, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    exec(compile(read_moulinette(archive), str(archive / MOULINETTE_NAME), 'exec'),
+         module.__dict__)
+    return module
+
+
+def load_moulinette(target: Path) -> ModuleType:
+    """
+    Function that returns the moulinette of a target folder or archive, loaded again whenever
+    it changes
+    """
+    if is_archive(target):
+        return extract_module_from_archive('moulinette', target, moulinette_version(target))
+    path = target / MOULINETTE_NAME
+    stat = path.stat()
+    return extract_module_from_path('moulinette', path, (stat.st_mtime_ns, stat.st_size))
+
+
+class FrozenDict(Mapping):
+    """A dict that cannot be modified, unlike a MappingProxyType it can be pickled"""
+    __slots__ = ('_data',)
+
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._data!r})'
+
+
+def freeze(value: Any) -> Any:
+    """
+    Function that returns a read-only copy of the lists, dicts, sets and bytearrays of a value,
+    nested ones included, as tuples, FrozenDicts, frozensets and bytes. Other objects are kept
+    as they are.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(map(freeze, value))
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, bytearray):
+        return bytes(value)
+    return value
+
+
+def load_fixtures(target: Path) -> tuple:
+    """
+    Function that returns the fixtures of the moulinette of a target, as the arguments to add
+    to its run function: (setup(),) frozen if it has a setup function, else none.
+
+    A moulinette sets up its fixtures once per version: pools set up the fixtures of their
+    targets before starting their workers, which inherit them. They are frozen so that no
+    submission can change what the next ones graded by the same worker are given.
+    """
+    key = (target, moulinette_version(target))
+    if (fixtures := _fixtures.get(key)) is None:
+        setup = getattr(load_moulinette(target), 'setup', None)
+        fixtures = _fixtures[key] = () if setup is None else (freeze(setup()),)
+    return fixtures
+
+
+def start_deadline() -> None:
+    """
+    Function that starts the timeout of the task this worker runs, when it was submitted with
+    a static timeout: the time the task spent cleaning and compiling does not count against it
+    """
+    global _deadline
+    if _deadline is not None:
+        conn, timeout = _deadline
+        _deadline = None
+        _limit_cpu(timeout)
+        conn.send((None, None))
+
+
+def _run_module(moulinette: ModuleType, module: ModuleType, new_code, report: Report,
+                fixtures: tuple = ()) -> Report:
+    start_deadline()
+    try:
+        with timed(report.timings, 'exec'), measured(report.usage):
+            # Compiled code may be shipped marshalled, code that does not compile as source
+            exec(marshal.loads(new_code) if isinstance(new_code, bytes) else new_code,
+                 module.__dict__)
+    except Exception as e:
+        report.add_malus_note(f"Error: {e}", 1)
+        return report
+
+    try:
+        with timed(report.timings, 'moulinette'), measured(report.usage):
+            moulinette.run(module, report, *fixtures)
+    except Exception as e:
+        report.add_note(f"Error: {e}")
+        return report
+    return report
+
+
+def run_in_process(target, new_code, file, report) -> Report:
+    moulinette = load_moulinette(target)
+    spec = importlib.util.spec_from_loader(file.stem, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    module.__dict__.update(prelude())
+    try:
+        return _run_module(moulinette, module, new_code, report, load_fixtures(target))
+    finally:
+        # The functions of the module and its globals reference each other: free what the
+        # submission allocated now, not at the next garbage collection of the worker
+        module.__dict__.clear()
+
+
+def _clean_and_compile(source: str, file: Path, report: Report) -> bytes | CodeType | str:
+    with timed(report.timings, 'clean'):
+        cleaned_code, report = ast_clean(source, report)
+    with timed(report.timings, 'compile'):
+        return compile_code(cleaned_code, file.name) if cleaned_code else ''
+
+
+def grade(target: Path, source: str, file: Path, report: Report) -> Report:
+    """
+    Function that cleans, compiles and runs a submission, in a worker
+    """
+    return run_in_process(target, _clean_and_compile(source, file, report), file, report)
+
+
+def _student_code(new_code: bytes | str) -> CodeType | str:
+    """
+    Function that returns the code of a submission compiled or marshalled, loaded once by this
+    worker for the tests of the submission
+    """
+    if (code := _codes.get(new_code)) is not None:
+        _codes.move_to_end(new_code)
+        return code
+    code = _codes[new_code] = marshal.loads(new_code) if isinstance(new_code, bytes) \
+        else new_code
+    while len(_codes) > CODES_PER_WORKER:
+        _codes.popitem(last=False)
+    return code
+
+
+def _student_module(name: str, new_code: bytes | str, report: Report) -> ModuleType | None:
+    """
+    Function that returns a module of a submission freshly executed, or None if executing it
+    fails. Its globals are to be cleared once it is used.
+    """
+    spec = importlib.util.spec_from_loader(name, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    module.__dict__.update(prelude())
+    start_deadline()
+    try:
+        with timed(report.timings, 'exec'), measured(report.usage):
+            exec(_student_code(new_code), module.__dict__)
+    except Exception as e:
+        module.__dict__.clear()
+        report.add_malus_note(f"Error: {e}", 1)
+        return None
+    return module
+
+
+def prepare_tests(target: Path, source: str, file: Path, report: Report
+                  ) -> tuple[Report, bytes | str | None]:
+    """
+    Function that cleans, compiles and executes a submission whose moulinette has a test
+    registry, in a worker that keeps its compiled code for the tests.
+
+    Returns the report and the compiled code to send along with each test, or None if the
+    submission cannot be executed.
+    """
+    code = _clean_and_compile(source, file, report)
+    if isinstance(code, CodeType):
+        code = marshal.dumps(code)
+    if (module := _student_module(file.stem, code, report)) is None:
+        return report, None
+    module.__dict__.clear()
+    return report, code
+
+
+def run_test(target: Path, name: str, new_code: bytes | str, test_name: str) -> Report:
+    """
+    Function that runs a test of the moulinette on a module of a submission executed for it,
+    so that no test sees what another one changed, and returns the report of the test
+    """
+    report = Report(name)
+    module = _student_module(name, new_code, report)
+    if module is None:
+        return report
+    test = tests_of(load_moulinette(target))[test_name]
+    try:
+        with timed(report.timings, 'moulinette'), measured(report.usage):
+            test.func(module, report, *load_fixtures(target))
+    except Exception as e:
+        report.add_note(f"Error: {e}")
+    finally:
+        module.__dict__.clear()
+    return report
+
+
+def init_worker(targets: tuple[Path, ...], fixtures: dict | None = None) -> None:
+    """
+    Worker initializer that loads the prelude and the moulinettes once per worker, along with
+    the fixtures set up by the pool
+    """
+    prelude()
+    _fixtures.update(fixtures or {})
+    for target in targets:
+        load_moulinette(target)
+
+
+def _limit_memory(memory_limit: int | None) -> None:
+    if resource is not None and memory_limit:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def _limit_cpu(timeout: float | None) -> None:
+    """Lets the worker use at most timeout more seconds of CPU, or lifts the limit"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = hard
+    if timeout is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # The limit has a one second granularity: round up so it never fires before the deadline
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + timeout) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn: Connection, targets: tuple[Path, ...], memory_limit: int | None,
+                 fixtures: dict) -> None:
+    global _deadline
+    # Ctrl-C is handled by the parent, which kills the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(targets, fixtures)
+    _limit_memory(memory_limit)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        func, args, timeout, static_timeout = message
+        if static_timeout is None or timeout is None:
+            _limit_cpu(timeout)
+        else:
+            _deadline = (conn, timeout)
+            _limit_cpu(static_timeout)
+        try:
+            result = (True, func(*args))
+        except BaseException as e:
+            result = (False, f'{e.__class__.__name__}: {e}')
+        _deadline = None
+        _limit_cpu(None)
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send((False, f'Unpicklable result: {e}'))
+
+
+def worker_context(start_method: str | None = None) -> multiprocessing.context.BaseContext:
+    """
+    Function that returns the multiprocessing context of the workers: the given start method,
+    or fork on Linux, so that workers start with the modules of the runner already loaded, and
+    a forkserver preloading the grading modules elsewhere
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if start_method is None:
+        start_method = 'fork' if sys.platform == 'linux' and 'fork' in methods \
+            else 'forkserver' if 'forkserver' in methods else 'spawn'
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload(PRELOADED_MODULES)
+    return context
+
+
+class TaskResult(NamedTuple):
+    """
+    The value returned by a task, or the reason why it has none, and the time it spent in the
+    queue, being sent to its worker and on its worker
+    """
+    key: Any
+    value: Any = None
+    error: str | None = None
+    timings: dict[str, float] | None = None
+
+
+class _Worker:
+    def __init__(self, context: multiprocessing.context.BaseContext, targets: tuple[Path, ...],
+                 memory_limit: int | None, fixtures: dict):
+        self.conn, child_conn = context.Pipe()
+        # Forked workers get the fixtures as they are in memory, others get them pickled
+        self.process = context.Process(target=_worker_main,
+                                       args=(child_conn, targets, memory_limit, fixtures),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task_key = None
+        self.timeout = self.deadline = None
+        self.timings = None
+        self.done = 0
+
+    def start(self, key: Any, func: Callable, args: tuple, timeout: float | None,
+              static_timeout: float | None, submitted: float) -> None:
+        start = time.perf_counter()
+        self.conn.send((func, args, timeout, static_timeout))
+        self.task_key = key
+        self.timeout = timeout
+        if timeout is not None and static_timeout is not None:
+            # Until the task starts its deadline, see start_deadline
+            timeout = static_timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self._started = time.perf_counter()
+        self.timings = {'queue': start - submitted, 'send': self._started - start}
+
+    def start_deadline(self) -> None:
+        self.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+
+    def elapsed(self) -> dict[str, float]:
+        """Returns the timings of the current task, up to now"""
+        return {**self.timings, 'worker': time.perf_counter() - self._started}
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Pool of warm workers that gives every task its own deadline.
+
+    The moulinettes of the given target folders are loaded as each worker starts; the pool can
+    also run the moulinettes of other folders, loaded on their first submission. A task only
+    starts when a worker is free, as soon as it is submitted if one is, and its deadline counts
+    from then: a worker that misses it is killed and replaced, without delaying the other
+    tasks. Queued tasks start by decreasing cost, then in submission order. Workers are also
+    limited in CPU time and address space, and replaced after max_tasks tasks. They are started
+    with the start method of worker_context, with the fixtures of the moulinettes of the target
+    folders set up once by the pool.
+    """
+
+    def __init__(self, targets: Iterable[Path] = (), processes: int | None = None,
+                 max_tasks: int | None = MAX_TASKS_PER_WORKER,
+                 timeout: float | None = DEFAULT_TIMEOUT,
+                 memory_limit: int | None = DEFAULT_MEMORY_LIMIT,
+                 start_method: str | None = None):
+        self.targets = tuple(targets)
+        self.context = worker_context(start_method)
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.fixtures = {(target, moulinette_version(target)): load_fixtures(target)
+                         for target in self.targets}
+        self._pending = []
+        self._order = itertools.count()
+        self._workers = [self._spawn() for _ in range(processes or os.cpu_count())]
+
+    def __enter__(self) -> 'WorkerPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.terminate()
+
+    @property
+    def processes(self) -> int:
+        return len(self._workers)
+
+    @property
+    def queued(self) -> int:
+        """The number of tasks waiting for a free worker"""
+        return len(self._pending)
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.context, self.targets, self.memory_limit, self.fixtures)
+
+    def submit(self, key: Any, func: Callable, *args: Any, timeout: float | None = None,
+               cost: float = 0., static_timeout: float | None = None) -> None:
+        """
+        Queues func(*args), and starts it right away if a worker is free, its result will be
+        given back by poll() or results() along with key. The task has the timeout of the pool,
+        unless given its own, and starts before the queued tasks of lower cost. With a static
+        timeout, the task has that long until it calls start_deadline, and its timeout from
+        then.
+        """
+        heapq.heappush(self._pending, (-cost, next(self._order), key, func, args,
+                                       time.perf_counter(),
+                                       self.timeout if timeout is None else timeout,
+                                       static_timeout))
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.task_key is None:
+                _, _, key, func, args, submitted, timeout, static_timeout = \
+                    heapq.heappop(self._pending)
+                worker.start(key, func, args, timeout, static_timeout, submitted)
+
+    def _finish(self, index: int) -> None:
+        worker = self._workers[index]
+        worker.task_key = worker.deadline = worker.timings = None
+        worker.done += 1
+        if self.max_tasks is not None and worker.done >= self.max_tasks:
+            worker.stop()
+            self._workers[index] = self._spawn()
+
+    def _replace(self, index: int) -> None:
+        self._workers[index].kill()
+        self._workers[index] = self._spawn()
+
+    def results(self) -> Iterator[TaskResult]:
+        """
+        Runs the queued tasks and yields their results as soon as each one finishes
+        """
+        while True:
+            self._dispatch()
+            if all(worker.task_key is None for worker in self._workers):
+                return
+            yield from self.poll()
+
+    def poll(self, timeout: float | None = None, wakeup: Iterable = ()) -> list[TaskResult]:
+        """
+        Starts the queued tasks, waits for one of them to finish, at most timeout seconds or
+        until one of the wakeup objects of multiprocessing.connection.wait is ready, and returns
+        the results of the tasks that finished
+        """
+        self._dispatch()
+        busy = [i for i, worker in enumerate(self._workers) if worker.task_key is not None]
+        wakeup = list(wakeup)
+        if not busy and not wakeup:
+            return []
+        deadlines = [self._workers[i].deadline for i in busy
+                     if self._workers[i].deadline is not None]
+        if timeout is not None:
+            deadlines.append(time.monotonic() + timeout)
+        timeout = max(0., min(deadlines) - time.monotonic()) if deadlines else None
+        wait([self._workers[i].conn for i in busy]
+             + [self._workers[i].process.sentinel for i in busy] + wakeup, timeout)
+
+        results = []
+        now = time.monotonic()
+        for i in busy:
+            worker = self._workers[i]
+            key = worker.task_key
+            success = None
+            try:
+                while success is None and worker.conn.poll():
+                    success, value = worker.conn.recv()
+                    if success is None:
+                        worker.start_deadline()
+            except (EOFError, OSError):
+                timings, error = worker.elapsed(), self._crash_reason(worker)
+                self._replace(i)
+                results.append(TaskResult(key, error=error, timings=timings))
+                continue
+            if success is not None:
+                timings = worker.elapsed()
+                self._finish(i)
+                if success:
+                    results.append(TaskResult(key, value, timings=timings))
+                else:
+                    results.append(TaskResult(key, error=f'Worker error: {value}',
+                                              timings=timings))
+            elif not worker.process.is_alive():
+                timings, error = worker.elapsed(), self._crash_reason(worker)
+                self._replace(i)
+                results.append(TaskResult(key, error=error, timings=timings))
+            elif worker.deadline is not None and now >= worker.deadline:
+                timings = worker.elapsed()
+                self._replace(i)
+                results.append(TaskResult(key, error='Timeout', timings=timings))
+        return results
+
+    @staticmethod
+    def _crash_reason(worker: _Worker) -> str:
+        worker.process.join(1)
+        if worker.process.exitcode == -getattr(signal, 'SIGXCPU', 0):
+            return 'Timeout'
+        return f'Worker crashed (exit code {worker.process.exitcode})'
+
+    def close(self) -> None:
+        """Stops the workers once they are idle, dropping the tasks not started yet"""
+        self._pending.clear()
+        for worker in self._workers:
+            worker.stop()
+        for worker in self._workers:
+            worker.process.join()
+
+    def terminate(self) -> None:
+        """Kills the workers right away"""
+        self._pending.clear()
+        for worker in self._workers:
+            worker.kill()
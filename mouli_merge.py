@@ -0,0 +1,43 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import Sequence
+
+from helper.merge import merge_outputs
+from mouli_runner import targets_validator
+
+
+def parse_args(args: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Merge the outputs of the shards of a run of '
+                                                 'the moulinette')
+    parser.add_argument('inputs', type=Path, nargs='+',
+                        help='The csv or .jsonl outputs of the shards, sorted by student as the '
+                             'runner writes them by default')
+    parser.add_argument('-o', '--output', type=Path,
+                        help='The merged output, in the format of the inputs (default: printed)')
+    parser.add_argument('--target', type=targets_validator, action='extend', default=[],
+                        help='A graded folder or archive, or a glob pattern of them, to check '
+                             'that no student is missing from the merged output; may be given '
+                             'several times')
+    return parser.parse_args(args)
+
+
+def mouli_merge(args: Sequence[str] | None = None) -> list[str]:
+    """
+    Function that merges the outputs of the shards, prints the students duplicated, missing or
+    unknown, and returns them
+    """
+    namespace = parse_args(args)
+    if namespace.output is None:
+        problems = merge_outputs(namespace.inputs, sys.stdout, namespace.target)
+    else:
+        with namespace.output.open('w', newline='') as f:
+            problems = merge_outputs(namespace.inputs, f, namespace.target)
+        print(f"Report saved in {namespace.output}")
+    for problem in problems:
+        print(problem)
+    return problems
+
+
+if __name__ == '__main__':
+    sys.exit(1 if mouli_merge() else 0)
@@ -1,121 +1,571 @@
 import argparse
-import collections
+import contextlib
 import csv
-import importlib.util
+import glob
+import hashlib
 import multiprocessing
-from functools import cache, partial
+import os
+import time
+from functools import partial
 from io import StringIO
-from multiprocessing import Pool, pool
 from pathlib import Path
-from types import ModuleType
-from typing import Sequence, IO
+from typing import IO, Callable, Iterable, Iterator, NamedTuple, Sequence
 
+from helper.cache import DEFAULT_CACHE_FOLDER, ReportCache
 from helper.clean_code import ast_clean
-from helper.insert_code import ast_insert
+from helper.distributed import AUTHKEY_VARIABLE, RemotePool, authkey_from_env, parse_address, \
+    serve_worker
+from helper.groups import SubmissionGroups
+from helper.profiling import Profile, merge_usage, timed
+from helper.registry import TestRegistry, add_test_report, tests_of
 from helper.report import Report
+from helper.results import EXPORT_FORMATS, ResultStore
+from helper.schedule import HISTORY_NAME, Scheduler
+from helper.submissions import ARCHIVE_SUFFIXES, DEFAULT_MAX_SIZE, MOULINETTE_NAME, \
+    Submission, SubmissionTooLarge, is_archive, iter_submissions, list_submissions, \
+    read_moulinette, read_submission, submission_size
+from helper.watch import FolderWatcher
+from helper.workers import DEFAULT_MEMORY_LIMIT, DEFAULT_TIMEOUT, STATIC_TIMEOUT, TaskResult, \
+    WorkerPool, grade, load_moulinette, prepare_tests, run_test
 
 
 def dir_validator(folder: str) -> Path:
     path = Path(folder).resolve()
-    if not path.is_dir():
-        raise ValueError(f"{folder} is not a valid folder")
+    if not path.is_dir() and not is_archive(path):
+        raise ValueError(f"{folder} is neither a valid folder nor an archive")
     return path
 
 
-def parse_args(args: Sequence[str] | None = None) -> tuple[Path, Path | None]:
+def targets_validator(pattern: str) -> list[Path]:
+    """
+    Function that returns the folders matching a glob pattern that have a moulinette and the
+    archives matching it, or the folder or archive itself when it is not a pattern
+    """
+    if not glob.has_magic(pattern):
+        return [dir_validator(pattern)]
+    targets = sorted(Path(path).resolve() for path in glob.glob(pattern)
+                     if (Path(path) / MOULINETTE_NAME).is_file() or is_archive(Path(path)))
+    if not targets:
+        raise ValueError(f"no folder with a {MOULINETTE_NAME} nor archive matches {pattern}")
+    return targets
+
+
+def shard_validator(shard: str) -> tuple[int, int]:
+    """
+    Function that returns the (i, n) of an i/n shard, the i-th of n, from 1 to n
+    """
+    index, _, count = shard.partition('/')
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ValueError(f"there is no shard {index} of {count}")
+    return index, count
+
+
+def parse_args(args: Sequence[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Run a moulinette to onto a folder')
-    parser.add_argument('target_folder', help='A folder with a moulinette.py inside',
-                        type=dir_validator)
+    parser.add_argument('target_folder', help='A folder with a moulinette.py inside, an archive '
+                                              f'({", ".join(ARCHIVE_SUFFIXES)}) with a '
+                                              'moulinette.py inside or next to it, or a glob '
+                                              'pattern of such folders and archives; several '
+                                              'folders are graded on the same workers',
+                        type=targets_validator, nargs='*')
     parser.add_argument('-o', '--output',
-                        help="The output file as a csv file with ';' as separator", type=Path)
+                        help="The output file as a csv file with ';' as separator, written as "
+                             "the submissions are graded. With several folders, it merges "
+                             "every folder, and each folder also gets an OUTPUT_<folder> file. "
+                             "A .jsonl, .sqlite or .db output is written once every submission "
+                             "is graded, as JSON Lines or as a SQLite database",
+                        type=Path)
+    parser.add_argument('--unsorted', action='store_true',
+                        help='Leave the rows of the output file in completion order instead of '
+                             'sorting them by student once every submission is graded')
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache', action='store_true',
+                             help='Neither read nor write the result cache, nor the history of '
+                                  'the time each student takes to grade')
+    cache_group.add_argument('--rebuild-cache', action='store_true',
+                             help='Ignore the cached results and grade every submission again')
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_FOLDER,
+                        help=f'The folder of the result cache (default: {DEFAULT_CACHE_FOLDER})')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='The number of worker processes (default: the number of CPUs)')
+    parser.add_argument('-t', '--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='The time a submission may run for, in seconds '
+                             f'(default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // 1024 ** 2,
+                        help='The address space of a worker, in MiB, 0 for no limit '
+                             f'(default: {DEFAULT_MEMORY_LIMIT // 1024 ** 2})')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE // 1024,
+                        help='Reject the submissions larger than this, in KiB, before reading '
+                             f'them, 0 for no limit (default: {DEFAULT_MAX_SIZE // 1024})')
+    parser.add_argument('--shard', metavar='I/N', type=shard_validator,
+                        help='Only grade the I-th of N shards of the students, from 1 to N, '
+                             'picked from a hash of their names; merge the outputs of the shards '
+                             'with mouli_merge.py')
+    parser.add_argument('--static-only', action='store_true',
+                        help='Only check the submissions against the rules, without running '
+                             'them nor the moulinette')
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(),
+                        help='How workers are started (default: fork on Linux, forkserver '
+                             'preloading the grading modules elsewhere when available)')
+    parser.add_argument('--serve', metavar='[HOST:]PORT', type=parse_address,
+                        help='Grade on remote workers connecting to this address instead of on '
+                             'local processes; the workers and the coordinator share the secret '
+                             f'of the {AUTHKEY_VARIABLE} environment variable')
+    parser.add_argument('--worker', metavar='HOST:PORT', type=parse_address,
+                        help='Run as a remote worker of the coordinator at this address, with '
+                             '--jobs processes, until the coordinator stops')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, and grade the submissions as they are added or '
+                             'modified')
+    parser.add_argument('--interval', type=float, default=1.,
+                        help='The time between two polls of the folder in watch mode, in '
+                             'seconds (default: 1)')
+    parser.add_argument('--usage', action='store_true',
+                        help='Add the CPU time, the RSS growth of its worker and the '
+                             'allocated blocks of each submission as csv columns')
+    parser.add_argument('--max-cpu', type=float,
+                        help='Give a malus to the submissions using more CPU time, in seconds')
+    parser.add_argument('--max-rss', type=int,
+                        help='Give a malus to the submissions growing the RSS of their worker by '
+                             'more than this, in MiB')
+    parser.add_argument('--groups', action='store_true',
+                        help='Print the groups of students whose submissions are the same up to '
+                             'identifiers, constants, whitespace and comments')
+    parser.add_argument('--groups-json', type=Path,
+                        help='Save the groups of similar submissions as a json file')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print the score histogram and how many students broke each rule')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in each phase, and the slowest students')
+    parser.add_argument('--profile-top', type=int, default=10,
+                        help='The number of slowest students and phases to print (default: 10)')
+    parser.add_argument('--profile-json', type=Path,
+                        help='Save the timings of every submission as a json file')
 
     namespace = parser.parse_args(args)
-    return namespace.target_folder, namespace.output
+    if (namespace.serve or namespace.worker) and not os.environ.get(AUTHKEY_VARIABLE):
+        parser.error(f'--serve and --worker need the {AUTHKEY_VARIABLE} environment variable')
+    if namespace.worker:
+        return namespace
+    if not namespace.target_folder:
+        parser.error('the following arguments are required: target_folder')
+    namespace.target_folder = list(dict.fromkeys(
+        target for targets in namespace.target_folder for target in targets))
+    if namespace.watch and len(namespace.target_folder) > 1:
+        parser.error('--watch only watches a single folder')
+    if namespace.watch and namespace.shard:
+        parser.error('--watch grades every submission of the folder, it cannot be --shard')
+    if namespace.watch and is_archive(namespace.target_folder[0]):
+        parser.error('--watch only watches a folder, not an archive')
+    if namespace.watch and namespace.static_only:
+        parser.error('--watch runs the moulinette, it cannot be --static-only')
+    if namespace.serve and namespace.static_only:
+        parser.error('--serve runs the moulinette, it cannot be --static-only')
+    return namespace
+
+
+class Batch(NamedTuple):
+    """
+    A target folder or archive to grade, with its cache, its submissions to grade, all the ones
+    of the shard by default, and the size over which they are rejected
+    """
+    target: Path
+    cache: ReportCache | None = None
+    files: Iterable[Submission] | None = None
+    max_size: int | None = DEFAULT_MAX_SIZE
+    shard: tuple[int, int] | None = None
+
+
+class Task(NamedTuple):
+    """
+    A submission graded on the pool, or one of its tests when test is set, with its expected
+    cost
+    """
+    target: Path
+    report: Report
+    key: str | None
+    code: str
+    digest: str | None = None
+    test: str | None = None
+    cost: float = 0.
+
 
+def rejected_report(file: Submission, error: Exception, timings: dict[str, float]) -> Report:
+    """
+    Function that returns the report of a submission rejected before being read, or as it is
+    not UTF-8
+    """
+    report = Report(file.stem)
+    if isinstance(error, UnicodeDecodeError):
+        report.add_malus_note(f"Not a valid python file: {error.reason} at byte {error.start}")
+    else:
+        report.add_malus_note(str(error))
+    report.timings = timings
+    return report
 
-@cache
-def extract_module_from_path(name: str, path: Path) -> ModuleType:
-    spec = importlib.util.spec_from_file_location(name, path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
 
+def run(target: Path, file: Submission, p: WorkerPool, cache: ReportCache | None = None,
+        duplicates: dict[tuple[Path, str], list[str]] | None = None,
+        max_size: int | None = DEFAULT_MAX_SIZE, cost: float = 0.) -> Report | None:
+    """
+    Function that submits the submission to the pool, or returns its cached report.
+
+    Only reading the file happens here: cleaning, compiling and running it happen in a worker,
+    so that workers start on the first submissions while the next ones are read. When the
+    moulinette has a test registry, the worker only executes the submission, and its tests are
+    submitted once it is ready.
 
-def run_in_process(target, new_code, file, report) -> tuple[int, str]:
-    moulinette = extract_module_from_path('moulinette', target / 'moulinette.py')
-    spec = importlib.util.spec_from_loader(file.stem, loader=None)
-    module = importlib.util.module_from_spec(spec)
+    A submission identical to one already submitted is not submitted again: its student is
+    added to the duplicates of the first one, which get a copy of its report. A submission over
+    max_size bytes is rejected without being read, one that is not UTF-8 once read, and one
+    deleted since it was listed is skipped. Submissions start by decreasing cost, their
+    expected worker time.
+    """
+    timings = {}
     try:
-        exec(new_code, module.__dict__)
-    except Exception as e:
-        report.add_malus_note(f"Error: {e}", 1)
-        return report
+        with timed(timings, 'read'):
+            source = read_submission(file, max_size)
+    except SubmissionTooLarge as e:
+        print(f"{file.stem} rejected")
+        return rejected_report(file, e, timings)
+    except FileNotFoundError:
+        # Deleted since the folder was listed, eg. while it is watched
+        print(f"{file.stem} deleted before being read")
+        return None
+    with timed(timings, 'cache'):
+        key = cache.key(source) if cache is not None else None
+        cached = cache.get(key, file.stem) if key is not None else None
+    if cached is not None:
+        print(f"{file.stem} cached")
+        cached.timings = timings
+        return cached
 
     try:
-        moulinette.run(module, report)
-    except Exception as e:
-        report.add_note(f"Error: {e}")
-        return report
+        code = source.decode('utf-8')
+    except UnicodeDecodeError as e:
+        print(f"{file.stem} rejected")
+        return rejected_report(file, e, timings)
+    report = Report(file.stem)
+    report.timings = timings
+
+    digest = None
+    if duplicates is not None:
+        digest = hashlib.sha256(source).hexdigest()
+        if (students := duplicates.get((target, digest))) is not None:
+            print(f"{file.stem} identical to a submission being graded")
+            students.append(file.stem)
+            return None
+        duplicates[(target, digest)] = []
+
+    print(f"{file.stem} started")
+    func = grade if tests_of(load_moulinette(target)) is None else prepare_tests
+    # Workers only need the name of the file, not its folder nor its archive
+    # Cleaning and compiling do not count against the timeout of the submission
+    p.submit(Task(target, report, key, code, digest, cost=cost), func, target, code,
+             Path(file.name), report, cost=cost, static_timeout=STATIC_TIMEOUT)
+    return None
+
+
+def submit_tests(p: WorkerPool, task: Task, new_code: bytes | str) -> dict[str, None]:
+    """
+    Function that submits every test of the moulinette on a submission ready for them, and
+    returns the slots of their reports
+    """
+    registry = tests_of(load_moulinette(task.target))
+    for test in registry:
+        p.submit(task._replace(test=test.name), run_test, task.target, task.report.student_name,
+                 new_code, test.name, timeout=test.timeout, cost=task.cost)
+    return dict.fromkeys(test.name for test in registry)
+
+
+def finish_test(task: Task, result: TaskResult) -> Report:
+    """
+    Function that returns the report of a test, a malus if its task failed
+    """
+    if result.error is None:
+        report = result.value
+    else:
+        report = Report(task.report.student_name)
+        report.add_malus_note(f"{task.test}: {result.error}")
+    report.timings.update(result.timings)
     return report
 
 
-Results = collections.namedtuple('Results', ['report', 'async_res'])
+def add_tests(report: Report, registry: TestRegistry, test_reports: dict[str, Report]
+              ) -> Report:
+    """
+    Function that adds the reports of the tests of a submission to its report, in the order of
+    the registry
+    """
+    for test in registry:
+        test_report = test_reports[test.name]
+        add_test_report(report, test, test_report)
+        for phase, seconds in test_report.timings.items():
+            report.timings[phase] = report.timings.get(phase, 0.) + seconds
+        merge_usage(report.usage, test_report.usage)
+    return report
 
 
-def run(target: Path, file: Path, p: pool.Pool, reports: list[Report]) -> Results:
+def static_report(report: Report, code: str, phase: str = 'clean') -> Report:
     """
-    Function that runs the moulinette
+    Function that fills the report of a submission with its static analysis, timed as the phase
+    """
+    with timed(report.timings, phase):
+        ast_clean(code, report)
+    return report
+
+
+def static_grade(file: Submission, max_size: int | None = DEFAULT_MAX_SIZE) -> Report:
+    """
+    Function that scores a submission on the rules only, with the same score and notes as the
+    static analysis of a full run
     """
     report = Report(file.stem)
     try:
-        cleaned_code, report = ast_clean(file.read_text(encoding='utf-8'), report)
+        with timed(report.timings, 'read'):
+            source = read_submission(file, max_size)
+    except SubmissionTooLarge as e:
+        return rejected_report(file, e, report.timings)
+    try:
+        code = source.decode('utf-8')
     except UnicodeDecodeError as e:
-        raise ValueError(f"{file.stem} is not a valid python file") from e
-    final_code = ast_insert(cleaned_code) if cleaned_code else ''
+        return rejected_report(file, e, report.timings)
+    return static_report(report, code)
 
-    def callback(report_: Report):
-        print(f"{file.stem} done")
-        reports.append(report_)
 
-    print(f"{file.stem} started")
-    run_in_process_ = partial(run_in_process, target, final_code, file, report)
-    async_res = p.apply_async(run_in_process_, callback=callback)
-    return Results(report, async_res)
-
-
-def run_moulinette_on_folder(target: Path) -> list[Report]:
-    with Pool(50) as p:
-        reports = []
-
-        results = [
-            (run(target, file, p, reports), file.stem)
-            for file in target.iterdir()
-            if file.is_file() and file.suffix == '.py' and file.name != 'moulinette.py'
-        ]
-    print("Waiting for results...")
-    for r,  name in results:
-        try:
-            r.async_res.get(timeout=1)
-        except multiprocessing.context.TimeoutError:
-            report = r.report
-            report.add_malus_note(f"Timeout")
-            reports.append(report)
+# Submissions sent at once to a static worker
+STATIC_CHUNK_SIZE = 64
+
 
-    return reports
+def iter_static_reports(targets: Sequence[Path], jobs: int | None = None,
+                        max_size: int | None = DEFAULT_MAX_SIZE,
+                        shard: tuple[int, int] | None = None) -> Iterator[tuple[Path, Report]]:
+    """
+    Function that yields the (target folder, static report) of every submission of the
+    folders, or of the shard, on a pool of processes when there are enough submissions to share
+    """
+    files = [(target, file) for target in targets
+             for file in list_submissions(target, max_size, shard)]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(files) <= STATIC_CHUNK_SIZE:
+        for target, file in files:
+            yield target, static_grade(file, max_size)
+        return
+    # Only the static mode needs it, and it is one of the slowest modules to import
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunk_size = max(1, min(STATIC_CHUNK_SIZE, len(files) // (4 * jobs)))
+    with ProcessPoolExecutor(jobs) as executor:
+        reports = executor.map(partial(static_grade, max_size=max_size),
+                               [file for _, file in files], chunksize=chunk_size)
+        yield from zip((target for target, _ in files), reports)
+
+
+def interleave(*iterables: Iterable) -> Iterator:
+    """
+    Function that yields the items of the iterables in turn, until they are all exhausted
+    """
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+
+# Submissions read ahead of the workers, per worker: enough for the slowest to start first,
+# few enough that the sources and reports waiting for a worker stay few
+QUEUED_PER_PROCESS = 4
 
 
-def to_csv(reports: list[Report], output: IO | None = None):
+def batch_submissions(batch: Batch, scheduler: Scheduler | None = None
+                      ) -> Iterator[tuple[Batch, Submission, float]]:
     """
-    Function that prints the reports in a csv format
+    Function that yields the (batch, submission, expected cost) of the submissions of a batch,
+    the costliest first unless they are read from an archive, which is streamed in order
+    """
+    files = iter_submissions(batch.target, batch.max_size, batch.shard) if batch.files is None \
+        else batch.files
+    if scheduler is None:
+        yield from ((batch, file, 0.) for file in files)
+    elif is_archive(batch.target):
+        yield from ((batch, file, scheduler.cost(batch.target, file.stem, file.size))
+                    for file in files)
+    else:
+        costs = [(batch, file, scheduler.cost(batch.target, file.stem, submission_size(file)))
+                 for file in files]
+        yield from sorted(costs, key=lambda item: item[2], reverse=True)
+
+
+def iter_batch_reports(batches: Sequence[Batch], p: WorkerPool | None = None,
+                       scheduler: Scheduler | None = None) -> Iterator[tuple[Path, Report]]:
+    """
+    Function that runs the moulinettes of several folders on a single pool, or on a pool of its
+    own, and yields each (target folder, report) as soon as it is ready.
+
+    The submissions of the folders are queued in turn, so that every folder progresses at the
+    same pace and the pool stays busy until the last folder is graded. Identical submissions
+    of a folder are only graded once. Submissions are read while the workers grade the first
+    ones, at most QUEUED_PER_PROCESS per worker ahead of them, so that memory stays flat.
+    """
+    own_pool = p is None
+    if own_pool:
+        p = WorkerPool([batch.target for batch in batches])
+    caches = {batch.target: batch.cache for batch in batches}
+    duplicates: dict[tuple[Path, str], list[str]] = {}
+    # The reports of the tests of each submission, by id of its report, None until done
+    tests: dict[int, dict[str, Report | None]] = {}
+    # The ids of the reports with a test that timed out or crashed its worker
+    failed: set[int] = set()
+
+    def identical(task: Task, report: Report) -> Iterator[tuple[Path, Report]]:
+        # The copies are made before the report is yielded: the consumer may add notes to it
+        copies = [report.renamed(name)
+                  for name in duplicates.pop((task.target, task.digest), ())]
+        yield task.target, report
+        yield from ((task.target, copy) for copy in copies)
+
+    def finish(result: TaskResult) -> Iterator[tuple[Path, Report]]:
+        task = result.key
+        cacheable = True
+        if task.test is not None:
+            test_reports = tests[id(task.report)]
+            test_reports[task.test] = finish_test(task, result)
+            if result.error is not None:
+                failed.add(id(task.report))
+            if None in test_reports.values():
+                return
+            del tests[id(task.report)]
+            # Timeouts and crashes depend on the load of the machine, like for a plain moulinette
+            cacheable = id(task.report) not in failed
+            failed.discard(id(task.report))
+            report = add_tests(task.report, tests_of(load_moulinette(task.target)),
+                               test_reports)
+        elif result.error is not None:
+            # In the parent, unlike the cleaning done by the worker that failed
+            report = static_report(task.report, task.code, 'static')
+            report.add_malus_note(result.error)
+            report.timings.update(result.timings)
+            yield from identical(task, report)
+            return
+        elif isinstance(result.value, tuple):
+            # Executed by prepare_tests, graded by its tests
+            report, new_code = result.value
+            report.timings.update(result.timings)
+            if new_code is not None:
+                task = task._replace(report=report)
+                tests[id(report)] = submit_tests(p, task, new_code)
+                return
+        else:
+            report = result.value
+            report.timings.update(result.timings)
+        print(f"{report.student_name} done")
+        if task.key is not None and cacheable:
+            caches[task.target].put(task.key, report)
+        yield from identical(task, report)
+
+    try:
+        for batch, file, cost in interleave(*(batch_submissions(batch, scheduler)
+                                              for batch in batches)):
+            if (cached := run(batch.target, file, p, batch.cache, duplicates,
+                              batch.max_size, cost)) is not None:
+                yield batch.target, cached
+            # Collect the results ready, and wait for the workers once enough are queued
+            while True:
+                backlog = p.queued > QUEUED_PER_PROCESS * max(1, p.processes)
+                for result in p.poll(None if backlog else 0):
+                    yield from finish(result)
+                if not backlog:
+                    break
+        print("Waiting for results...")
+        for result in p.results():
+            yield from finish(result)
+    finally:
+        if own_pool:
+            p.terminate()
+
+    # Every folder shares the cache folder: trim each one once
+    for cache in {cache.folder: cache for cache in caches.values() if cache is not None}.values():
+        cache.evict()
+
+
+def iter_reports(target: Path, cache: ReportCache | None = None,
+                 p: WorkerPool | None = None, files: Iterable[Submission] | None = None,
+                 max_size: int | None = DEFAULT_MAX_SIZE) -> Iterator[Report]:
+    """
+    Function that runs the moulinette on the given submissions, every submission of the folder
+    by default, on the given pool or on a pool of its own, and yields each report as soon as it
+    is ready
+    """
+    for _, report in iter_batch_reports([Batch(target, cache, files, max_size)], p):
+        yield report
+
+
+def run_moulinette_on_folder(target: Path, cache: ReportCache | None = None,
+                             p: WorkerPool | None = None) -> list[Report]:
+    """
+    Function that runs the moulinette on every submission of the folder
+    """
+    return list(iter_reports(target, cache, p))
+
+
+def congratulate(report: Report) -> Report:
+    if report.score == 20:
+        report.add_note("Congratulations !")
+    return report
+
+
+def cpu_time(report: Report) -> float:
+    return report.usage.get('cpu_user', 0.) + report.usage.get('cpu_system', 0.)
+
+
+def check_usage(report: Report, max_cpu: float | None = None, max_rss: int | None = None
+                ) -> Report:
+    """
+    Function that gives a malus to a submission using more CPU time, in seconds, or growing the
+    RSS of its worker by more MiB than allowed
+    """
+    if max_cpu is not None and cpu_time(report) > max_cpu:
+        report.add_malus_note(f"Heavy CPU usage: {cpu_time(report):.2f} s")
+    if max_rss is not None and report.usage.get('peak_rss', 0) > max_rss * 1024:
+        report.add_malus_note(f"Heavy memory usage: {report.usage['peak_rss'] // 1024} MiB")
+    return report
+
+
+CSV_HEADERS = ['Student', 'Grade', 'Comment']
+USAGE_CSV_HEADERS = ['CPU (s)', 'RSS growth (KiB)', 'Blocks']
+
+
+def csv_headers(usage: bool = False, batch: bool = False) -> list[str]:
+    headers = CSV_HEADERS + USAGE_CSV_HEADERS if usage else CSV_HEADERS
+    return ['Folder', *headers] if batch else headers
+
+
+def csv_row(report: Report, usage: bool = False) -> list:
+    row = [report.student_name, report.score, ', '.join(report.notes)]
+    if usage:
+        # Left empty for the submissions that did not run
+        row += [f'{cpu_time(report):.3f}', report.usage.get('peak_rss', ''),
+                report.usage.get('blocks', '')] if report.usage else ['', '', '']
+    return row
+
+
+def to_csv(reports: Iterable[Report], output: IO | None = None, usage: bool = False):
+    """
+    Function that prints the reports in a csv format, with their resource usage if asked.
+
+    Rows are flushed as soon as they are written, so that the rows of a stream of reports
+    survive an interrupted run.
     """
     if output is None:
         output = StringIO()
     writer = csv.writer(output, delimiter=';', escapechar='\\')
-    headers = ['Student', 'Grade', 'Comment']
-
-    writer.writerow(headers)
+    writer.writerow(csv_headers(usage))
     for report in reports:
-        writer.writerow([report.student_name, report.score, ', '.join(report.notes)])
+        writer.writerow(csv_row(report, usage))
+        output.flush()
 
     if isinstance(output, StringIO):
         print(output.getvalue())
@@ -123,19 +573,252 @@ def to_csv(reports: list[Report], output: IO | None = None):
         print(f"Report saved in {output.name}")
 
 
-def mouli_runner(args: Sequence[str] | None = None):
-    target, output = parse_args(args)
-    reports = run_moulinette_on_folder(target)
+def sort_csv(path: Path, columns: int = 1) -> None:
+    """
+    Function that sorts the rows of a csv report by student, or by their first columns
+    """
+    with path.open(newline='') as f:
+        reader = csv.reader(f, delimiter=';', escapechar='\\')
+        headers = next(reader)
+        rows = sorted(reader, key=lambda row: row[:columns])
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with tmp.open('w', newline='') as f:
+        writer = csv.writer(f, delimiter=';', escapechar='\\')
+        writer.writerow(headers)
+        writer.writerows(rows)
+    os.replace(tmp, path)
 
-    for report in reports:
-        if report.score == 20:
-            report.add_note("Congratulations !")
 
-    if output is not None:
-        with output.open('w', newline='') as f:
-            to_csv(reports, f)
+def folder_output(output: Path, target: Path) -> Path:
+    """
+    Function that returns the output file of a folder graded along other ones
+    """
+    return output.with_name(f'{output.stem}_{target.name}{output.suffix}')
+
+
+def to_batch_csv(reports: Iterable[tuple[Path, Report]], targets: Sequence[Path],
+                 output: Path | None, sort: bool = True, usage: bool = False) -> None:
+    """
+    Function that writes the reports of several folders in a merged csv, with the folder of each
+    report, and in a csv per folder, or prints the merged csv.
+
+    Rows are flushed as soon as they are written, as in to_csv.
+    """
+    if output is None:
+        rows = sorted([target.name, *csv_row(report, usage)] for target, report in reports)
+        f = StringIO()
+        writer = csv.writer(f, delimiter=';', escapechar='\\')
+        writer.writerow(csv_headers(usage, batch=True))
+        writer.writerows(rows)
+        print(f.getvalue())
+        return
+
+    with contextlib.ExitStack() as stack:
+        merged = stack.enter_context(output.open('w', newline=''))
+        merged_writer = csv.writer(merged, delimiter=';', escapechar='\\')
+        merged_writer.writerow(csv_headers(usage, batch=True))
+        files, writers = {}, {}
+        for target in targets:
+            files[target] = stack.enter_context(
+                folder_output(output, target).open('w', newline=''))
+            writers[target] = csv.writer(files[target], delimiter=';', escapechar='\\')
+            writers[target].writerow(csv_headers(usage))
+        for target, report in reports:
+            row = csv_row(report, usage)
+            writers[target].writerow(row)
+            files[target].flush()
+            merged_writer.writerow([target.name, *row])
+            merged.flush()
+
+    if sort:
+        sort_csv(output, 2)
+    for target in targets:
+        if sort:
+            sort_csv(folder_output(output, target))
+        print(f"Report saved in {folder_output(output, target)}")
+    print(f"Report saved in {output}")
+
+
+def write_table(table: dict[str, Report], output: Path | None, folder: str = '',
+                usage: bool = False) -> None:
+    """
+    Function that replaces the output file, or prints, with the reports sorted by student, in
+    the export format of the output if it has one, and with their resource usage if asked
+    """
+    reports = [table[student] for student in sorted(table)]
+    if output is None:
+        to_csv(reports, usage=usage)
+        return
+    if output.suffix in EXPORT_FORMATS:
+        # The temporary file keeps the suffix, which gives the export format
+        tmp = output.with_name(f'.tmp_{output.name}')
+        store = ResultStore()
+        for report in reports:
+            store.add(report, folder)
+        store.export(tmp)
     else:
-        to_csv(reports)
+        tmp = output.with_name(f'.{output.name}.tmp')
+        with tmp.open('w', newline='') as f:
+            writer = csv.writer(f, delimiter=';', escapechar='\\')
+            writer.writerow(csv_headers(usage))
+            writer.writerows(csv_row(report, usage) for report in reports)
+    os.replace(tmp, output)
+    print(f"Report saved in {output}")
+
+
+def watch_folder(target: Path, p: WorkerPool, output: Path | None, interval: float,
+                 make_cache: Callable[[], ReportCache | None],
+                 max_size: int | None = DEFAULT_MAX_SIZE, max_cpu: float | None = None,
+                 max_rss: int | None = None, usage: bool = False) -> None:
+    """
+    Function that grades the submissions of the folder as they are added or modified, until
+    interrupted, with the usage checks and columns of a full run.
+
+    The pool and its moulinette stay loaded between two changes: only new or modified
+    submissions are graded again, every one of them if the moulinette itself changes. A
+    moulinette that fails to load, half saved or broken, keeps the previous grades: the
+    submissions changed meanwhile are graded once it loads again.
+    """
+    watcher = FolderWatcher(target)
+    table: dict[str, Report] = {}
+    cache = make_cache()
+    # The submissions to grade, and whether the moulinette changed, since the last grading
+    modified: dict[Path, None] = {}
+    moulinette_changed = False
+    error = None
+    print(f"Watching {target}, press Ctrl-C to stop")
+    try:
+        while True:
+            changes = watcher.poll()
+            modified.update(dict.fromkeys(changes.modified))
+            moulinette_changed |= changes.moulinette
+            for file in changes.deleted:
+                table.pop(file.stem, None)
+                modified.pop(file, None)
+            if moulinette_changed or modified or changes.deleted:
+                try:
+                    load_moulinette(target)
+                    if moulinette_changed:
+                        cache = make_cache()
+                except Exception as e:
+                    # Tried again on every poll, but only reported once
+                    if f'{e.__class__.__name__}: {e}' != error:
+                        error = f'{e.__class__.__name__}: {e}'
+                        print(f"{MOULINETTE_NAME} cannot be loaded, keeping the previous "
+                              f"grades: {error}")
+                else:
+                    error = None
+                    if moulinette_changed:
+                        print(f"{MOULINETTE_NAME} changed, grading every submission again")
+                        table.clear()
+                        modified = dict.fromkeys(watcher.files())
+                    for report in iter_reports(target, cache, p, list(modified), max_size):
+                        # A malus first, so that only the reports still perfect are congratulated
+                        table[report.student_name] = congratulate(check_usage(report, max_cpu,
+                                                                              max_rss))
+                    modified.clear()
+                    moulinette_changed = False
+                    write_table(table, output, target.name, usage)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def mouli_runner(args: Sequence[str] | None = None):
+    namespace = parse_args(args)
+    if namespace.worker:
+        serve_worker(namespace.worker, authkey_from_env(), namespace.jobs,
+                     namespace.memory_limit * 1024 ** 2, namespace.start_method)
+        return
+    targets, output = namespace.target_folder, namespace.output
+    max_size = namespace.max_size * 1024 or None
+
+    def make_cache(target: Path) -> ReportCache | None:
+        if namespace.no_cache:
+            return None
+        return ReportCache(read_moulinette(target), namespace.cache_dir,
+                           refresh=namespace.rebuild_cache, timeout=namespace.timeout,
+                           memory_limit=namespace.memory_limit * 1024 ** 2 or None)
+
+    p = None
+    if namespace.serve:
+        p = RemotePool(namespace.serve, authkey_from_env(), timeout=namespace.timeout)
+    elif not namespace.static_only:
+        p = WorkerPool(targets, namespace.jobs, timeout=namespace.timeout,
+                       memory_limit=namespace.memory_limit * 1024 ** 2,
+                       start_method=namespace.start_method)
+    if namespace.watch:
+        try:
+            watch_folder(targets[0], p, output, namespace.interval,
+                         lambda: make_cache(targets[0]), max_size, namespace.max_cpu,
+                         namespace.max_rss, namespace.usage)
+        finally:
+            p.terminate()
+        return
+
+    profile = Profile() if namespace.profile or namespace.profile_json else None
+    groups = SubmissionGroups() if namespace.groups or namespace.groups_json else None
+    # Students have the same name in every folder
+    name = (lambda target, report: f'{target.name}/{report.student_name}') \
+        if len(targets) > 1 else (lambda target, report: report.student_name)
+    export = output is not None and output.suffix in EXPORT_FORMATS
+    store = ResultStore() if export or namespace.stats else None
+    scheduler = None
+    if p is not None and not namespace.no_cache:
+        scheduler = Scheduler(namespace.cache_dir / HISTORY_NAME)
+    try:
+        if p is None:
+            reports = iter_static_reports(targets, namespace.jobs, max_size, namespace.shard)
+        else:
+            batches = [Batch(target, make_cache(target), max_size=max_size,
+                             shard=namespace.shard) for target in targets]
+            reports = ((target, congratulate(check_usage(report, namespace.max_cpu,
+                                                         namespace.max_rss)))
+                       for target, report in iter_batch_reports(batches, p, scheduler))
+            if scheduler is not None:
+                reports = ((target, scheduler.record(target, report))
+                           for target, report in reports)
+        if profile is not None:
+            reports = ((target, profile.record(report, name(target, report)))
+                       for target, report in reports)
+        if groups is not None:
+            reports = ((target, groups.record(report, name(target, report), target.name))
+                       for target, report in reports)
+        if store is not None:
+            reports = ((target, store.add(report, target.name)) for target, report in reports)
+        if export:
+            for _ in reports:
+                pass
+            store.export(output, not namespace.unsorted)
+            print(f"Report saved in {output}")
+        elif len(targets) > 1:
+            to_batch_csv(reports, targets, output, not namespace.unsorted, namespace.usage)
+        elif output is not None:
+            # Each row is written as soon as its submission is graded
+            with output.open('w', newline='') as f:
+                to_csv((report for _, report in reports), f, namespace.usage)
+            if not namespace.unsorted:
+                sort_csv(output)
+        else:
+            to_csv(sorted((report for _, report in reports),
+                          key=lambda report: report.student_name), usage=namespace.usage)
+        if scheduler is not None and scheduler.durations:
+            scheduler.save()
+            print(scheduler.summary(p.processes))
+    finally:
+        if p is not None:
+            p.terminate()
+
+    if namespace.stats:
+        print(store.summary())
+    if namespace.groups:
+        print(groups.summary())
+    if namespace.groups_json is not None:
+        groups.dump(namespace.groups_json)
+    if namespace.profile:
+        print(profile.summary(namespace.profile_top))
+    if namespace.profile_json is not None:
+        profile.dump(namespace.profile_json)
 
 
 if __name__ == '__main__':
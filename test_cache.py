@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from helper.cache import ReportCache
+from helper.report import Report
+
+
+def make_cache(tmp_path: Path, moulinette_source: str = 'def run(module, report): ...',
+               **kwargs) -> ReportCache:
+    moulinette = tmp_path / 'moulinette.py'
+    moulinette.write_text(moulinette_source)
+    return ReportCache(moulinette, tmp_path / 'cache', **kwargs)
+
+
+def test_cache_round_trip(tmp_path):
+    """
+    A stored report is given back under the name of the student asking for it
+    """
+    cache = make_cache(tmp_path)
+    report = Report('student_1')
+    report.add_malus_note('Forbidden for loops: 2', 2)
+    key = cache.key(b'def f(): ...')
+    assert cache.get(key, 'student_1') is None
+
+    cache.put(key, report)
+    cached = cache.get(key, 'student_2')
+    assert (cached.student_name, cached.score, cached.notes) == \
+           ('student_2', -2, ['Forbidden for loops: 2'])
+
+
+def test_cache_key_depends_on_moulinette(tmp_path):
+    """
+    Editing the moulinette invalidates every cached report
+    """
+    key = make_cache(tmp_path).key(b'def f(): ...')
+    assert make_cache(tmp_path, 'def run(module, report): pass').key(b'def f(): ...') != key
+
+
+def test_cache_refresh_and_eviction(tmp_path):
+    """
+    A refreshing cache never hits, and eviction keeps the cache under its size
+    """
+    cache = make_cache(tmp_path, max_size=0)
+    key = cache.key(b'')
+    cache.put(key, Report('student_1'))
+    assert make_cache(tmp_path, refresh=True).get(key, 'student_1') is None
+
+    cache.evict()
+    assert cache.get(key, 'student_1') is None
+
+
+def test_cache_key_depends_on_limits(tmp_path):
+    """
+    A report graded with other limits is not reused: a submission may time out with a lower one
+    """
+    key = make_cache(tmp_path, timeout=10.).key(b'def f(): ...')
+    assert make_cache(tmp_path, timeout=0.05).key(b'def f(): ...') != key
+    assert make_cache(tmp_path, timeout=10., memory_limit=1024 ** 2).key(b'def f(): ...') != key
+    assert make_cache(tmp_path, timeout=10.).key(b'def f(): ...') == key
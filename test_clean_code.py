@@ -0,0 +1,62 @@
+from ast import unparse
+
+from helper.clean_code import ast_clean
+from helper.report import Report
+
+
+def clean(code: str) -> tuple[str, Report]:
+    cleaned_node, report = ast_clean(code, Report('student'))
+    return unparse(cleaned_node), report
+
+
+def test_clean_deletes_forbidden_nodes():
+    """
+    Forbidden nodes are deleted, and so are the nodes that lost a required child
+    """
+    code, report = clean('import os\nx = len(a) + 1\nprint(x)\ny = z.w\ndef f(n):\n'
+                         '    for i in n:\n        pass\n    return n\n')
+    assert code == 'def f(n):\n    return n'
+    assert report.notes == ['Forbidden imports: os', 'Forbidden names: len, print',
+                            'Forbidden attributes: w', 'Forbidden for loops: 1']
+    assert report.score == -5
+
+
+def test_clean_repairs_nodes():
+    """
+    While else clauses and forbidden arguments are removed without deleting their node
+    """
+    code, report = clean('def f(a, b=1, *args):\n    while a:\n        a = b\n    else:\n'
+                         '        b = a\n    return a\n')
+    assert code == 'def f(a, b):\n    while a:\n        a = b\n    return a'
+    assert report.notes == ['Forbidden while else clauses: 1', 'Forbidden arguments: 1']
+
+
+def test_clean_post_rules():
+    """
+    Assignments to authorized builtin names are reported once their value is cleaned
+    """
+    code, report = clean('int = 3\nlist = sum\nx = type("A", (), {})\nf(*x)\n')
+    assert code == 'f()'
+    assert report.notes == ['Forbidden function calls: 3 args form of type',
+                            'Forbidden names: sum', 'Forbidden assignments: int',
+                            'Forbidden starred expressions: *x']
+
+
+def test_clean_parse_error():
+    cleaned_node, report = ast_clean('def f(:\n', Report('student'))
+    assert cleaned_node is None
+    assert report.score == -1 and report.notes[0].startswith('Parse error: ')
+
+
+def test_fingerprint_ignores_identifiers_and_layout():
+    """
+    Submissions differing in identifiers, constants, whitespace and comments share a
+    fingerprint, not the ones differing in structure or operators
+    """
+    sources = ['def f(n):\n    return n + 1\n',
+               'def   g(m):  # renamed\n    return m + 2\n',
+               'def f(n):\n    return n - 1\n',
+               'def f(n):\n    return n + 1\n\n\nx = 1\n']
+    fingerprints = [ast_clean(code, Report('student'))[1].fingerprint for code in sources]
+    assert fingerprints[0] == fingerprints[1]
+    assert len(set(fingerprints[1:])) == 3
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from helper.distributed import AUTHKEY_VARIABLE, RemotePool
+from helper.report import Report
+from helper.workers import grade
+
+MOULINETTE = '''
+import time
+
+
+def run(module, report):
+    time.sleep(0.2)
+    report.add_bonus_note(f'{module.f()}')
+'''
+AUTHKEY = 'test-secret'
+ROOT = Path(__file__).resolve().parent
+
+
+def start_worker(address: tuple[str, int]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, 'mouli_runner.py', '--worker',
+                             f'{address[0]}:{address[1]}', '-j', '1'],
+                            cwd=ROOT, env={**os.environ, AUTHKEY_VARIABLE: AUTHKEY},
+                            stdout=subprocess.DEVNULL)
+
+
+def test_tasks_of_a_dead_worker_are_queued_again(tmp_path: Path):
+    """
+    Every task gets a single result, even when the worker running it is killed
+    """
+    (tmp_path / 'moulinette.py').write_text(MOULINETTE)
+    workers = []
+    with RemotePool(('127.0.0.1', 0), AUTHKEY.encode(), timeout=5.) as p:
+        for i in range(8):
+            p.submit(i, grade, tmp_path, f'def f():\n    return {i}\n',
+                     tmp_path / f'student_{i}.py', Report(f'student_{i}'))
+        workers.append(start_worker(p.address))
+        results = []
+        for result in p.results():
+            results.append(result)
+            if len(workers) == 1:
+                # The first worker still holds tasks sent ahead of its free process
+                workers[0].kill()
+                workers.append(start_worker(p.address))
+    for worker in workers:
+        worker.wait(10)
+    assert sorted((result.key, result.error, result.value.notes) for result in results) == \
+           [(i, None, [str(i)]) for i in range(8)]
@@ -0,0 +1,55 @@
+import marshal
+
+from helper.clean_code import ast_clean
+from helper.insert_code import ast_compile, ast_insert, prelude
+from helper.report import Report
+
+
+def test_compile_keeps_student_line_numbers():
+    """
+    Code compiled straight from the AST reports the lines of the student file
+    """
+    cleaned_node, _ = ast_clean('x = 1\n\n\ndef f():\n    return [1] + [2]\n', Report('student'))
+    code = ast_compile(cleaned_node, 'student.py')
+    assert isinstance(code, bytes)
+
+    namespace = dict(prelude())
+    exec(marshal.loads(code), namespace)
+    try:
+        namespace['f']()
+    except Exception as e:
+        assert e.args == ("Forbidden use of '+' on a list",)
+        assert e.__traceback__.tb_next.tb_frame.f_code.co_filename == 'student.py'
+        assert e.__traceback__.tb_next.tb_lineno == 5
+    else:
+        raise AssertionError('list_ guard not inserted')
+
+
+def test_compile_falls_back_on_source():
+    """
+    A tree left invalid by the cleaner is returned as source
+    """
+    cleaned_node, _ = ast_clean('def f():\n    for i in x:\n        pass\n', Report('student'))
+    code = ast_compile(cleaned_node, 'student.py')
+    assert code == 'def f():'
+
+
+def test_list_guard_without_temporary_lists():
+    """
+    Empty and constant list literals are built without a temporary list, and lists that are
+    assigned to are left as they are
+    """
+    cleaned_node, _ = ast_clean('[a, b] = [1, 2]\nx = []\ny = [a] * 2\n', Report('student'))
+    assert ast_insert(cleaned_node) == '[a, b] = list_((1, 2))\nx = list_()\ny = list_([a]) * 2'
+
+    namespace = dict(prelude())
+    exec(marshal.loads(ast_compile(cleaned_node, 'student.py')), namespace)
+    assert type(namespace['x']) is type(namespace['y']) is namespace['list_']
+    assert list(namespace['y']) == [1, 1]
+    for operation in ('x + y', 'x == y', 'x < y', 'y *= 2'):
+        try:
+            exec(operation, namespace)
+        except Exception as e:
+            assert e.args[0].startswith('Forbidden use of')
+        else:
+            raise AssertionError(f'{operation} allowed on a list')
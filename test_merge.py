@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from benchmarks.generator import generate_cohort
+from helper.submissions import in_shard
+from mouli_merge import mouli_merge
+from mouli_runner import mouli_runner
+
+
+def test_shards_partition_the_students():
+    students = [f'student_{i}' for i in range(100)]
+    shards = [[student for student in students if in_shard(student, (i, 3))]
+              for i in range(1, 4)]
+    assert sorted(sum(shards, [])) == sorted(students)
+    assert all(shards)
+
+
+def test_merged_shards_match_a_full_run(tmp_path: Path):
+    """
+    The outputs of the shards of a run merge into the output of the whole run, and students
+    missing or graded twice are reported
+    """
+    folder = generate_cohort(tmp_path / 'functions', 12, mix={'clean': 1, 'forbidden': 1})
+    for suffix in ('.csv', '.jsonl'):
+        full = tmp_path / f'full{suffix}'
+        mouli_runner([str(folder), '--static-only', '-o', str(full)])
+        shards = [tmp_path / f'shard_{i}{suffix}' for i in range(1, 4)]
+        for i, shard in enumerate(shards, 1):
+            mouli_runner([str(folder), '--static-only', '--shard', f'{i}/3', '-o', str(shard)])
+        merged = tmp_path / f'merged{suffix}'
+        assert mouli_merge([*map(str, shards), '-o', str(merged), '--target', str(folder)]) == []
+        assert merged.read_text() == full.read_text()
+
+    merged = tmp_path / 'merged.csv'
+    shards = [tmp_path / 'shard_1.csv', tmp_path / 'shard_1.csv', tmp_path / 'shard_2.csv']
+    problems = mouli_merge([*map(str, shards), '-o', str(merged), '--target', str(folder)])
+    missing = [line.split(';')[0]
+               for line in (tmp_path / 'shard_3.csv').read_text().splitlines()[1:]]
+    assert sorted(problem for problem in problems if problem.startswith('Missing')) == \
+           [f'Missing: {student}' for student in missing]
+    assert len([problem for problem in problems if problem.startswith('Duplicated')]) == \
+           len((tmp_path / 'shard_1.csv').read_text().splitlines()) - 1
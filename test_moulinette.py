@@ -1,8 +1,380 @@
-from mouli_runner import mouli_runner
+import csv
+import json
+import random
+import shutil
+import tarfile
+import zipfile
 
+from benchmarks.generator import SOLUTION, generate_cohort, generate_functions
+from helper.clean_code import ast_clean
+from helper.report import Report
+from helper.submissions import DEFAULT_MAX_SIZE, submission_names
+from helper.workers import WorkerPool
+from mouli_runner import interleave, iter_reports, mouli_runner, sort_csv, to_csv, \
+    write_table
 
-def test_moulinette():
+
+def test_moulinette(tmp_path):
     """
     Test moulinette
     """
-    assert mouli_runner(['functions'])
+    folder = generate_cohort(tmp_path / 'functions', 12, mix={'clean': 1, 'forbidden': 1,
+                                                              'syntax_error': 1,
+                                                              'infinite_loop': 1})
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(folder), '--no-cache', '-t', '0.5', '-o', str(output)])
+
+    with output.open(newline='') as f:
+        rows = list(csv.reader(f, delimiter=';', escapechar='\\'))
+    assert rows[0] == ['Student', 'Grade', 'Comment']
+    assert [row[0] for row in rows[1:]] == sorted(file.stem for file in folder.iterdir()
+                                                  if file.name.startswith('student_'))
+    for student, grade, comment in rows[1:]:
+        if student.endswith('_clean'):
+            assert (grade, comment) == ('2', 'exercice_1 OK, exercice_2 OK')
+        elif student.endswith('_syntax_error'):
+            assert comment.startswith('Parse error')
+        elif student.endswith('_infinite_loop'):
+            assert comment.endswith('Timeout')
+        else:
+            assert comment.startswith('Forbidden')
+
+
+def test_to_csv_streams_rows(tmp_path):
+    """
+    Rows are in the file as soon as their report is written, and can be sorted afterwards
+    """
+    output = tmp_path / 'output.csv'
+
+    def reports():
+        for name in ['student_2', 'student_1']:
+            report = Report(name)
+            report.add_bonus_note('exercice_1 OK; really')
+            yield report
+            assert output.read_text().splitlines()[-1].startswith(name)
+
+    with output.open('w', newline='') as f:
+        to_csv(reports(), f)
+    sort_csv(output)
+    assert output.read_text().splitlines() == ['Student;Grade;Comment',
+                                               'student_1;1;"exercice_1 OK; really"',
+                                               'student_2;1;"exercice_1 OK; really"']
+
+
+def test_mouli_runner_grades_several_folders(tmp_path):
+    """
+    Several folders are graded together, in a merged csv and a csv per folder
+    """
+    for i in range(2):
+        generate_cohort(tmp_path / f'exercice_{i}', 3, seed=i, mix={'clean': 1})
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(tmp_path / 'exercice_*'), '--no-cache', '-o', str(output)])
+
+    merged = output.read_text().splitlines()
+    assert merged[0] == 'Folder;Student;Grade;Comment'
+    assert [line.split(';')[:2] for line in merged[1:]] == \
+           [[f'exercice_{i}', f'student_{j}_clean'] for i in range(2) for j in range(3)]
+    for i in range(2):
+        lines = (tmp_path / f'output_exercice_{i}.csv').read_text().splitlines()
+        assert lines == ['Student;Grade;Comment'] + [line.split(';', 1)[1] for line in merged
+                                                     if line.startswith(f'exercice_{i};')]
+
+
+def test_interleave():
+    assert list(interleave('abc', '', 'de')) == ['a', 'd', 'b', 'e', 'c']
+
+
+def test_static_only_matches_full_run(tmp_path):
+    """
+    The static-only mode gives the notes a full run starts with, without running anything
+    """
+    folder = generate_cohort(tmp_path / 'functions', 8, mix={'clean': 1, 'forbidden': 1,
+                                                             'syntax_error': 1,
+                                                             'infinite_loop': 1})
+    outputs = {}
+    for mode in ([], ['--static-only']):
+        output = tmp_path / f'output{len(mode)}.csv'
+        mouli_runner([str(folder), '--no-cache', '-t', '0.5', '-o', str(output), *mode])
+        with output.open(newline='') as f:
+            outputs[bool(mode)] = list(csv.reader(f, delimiter=';', escapechar='\\'))[1:]
+
+    for (student, _, comment), (static_student, grade, static_comment) in \
+            zip(outputs[False], outputs[True]):
+        assert student == static_student and comment.startswith(static_comment)
+        _, report = ast_clean((folder / f'{student}.py').read_text(), Report(student))
+        assert (int(grade), static_comment) == (report.score, ', '.join(report.notes))
+        if student.endswith('_clean'):
+            assert (grade, static_comment) == ('0', '')
+
+
+REGISTRY_MOULINETTE = '''from helper.registry import TestRegistry
+
+tests = TestRegistry()
+
+
+@tests.test(weight=2)
+def exercice_1(module, report):
+    report.add_bonus_note(f'exercice_1 {module.f(1)}')
+
+
+@tests.test(timeout=0.5)
+def exercice_2(module, report):
+    module.f(-1)
+    report.add_bonus_note('exercice_2 OK')
+
+
+run = tests.run
+'''
+
+
+def test_registry_tests_time_out_alone(tmp_path):
+    """
+    The tests of a registry run as tasks of their own: a looping test only costs its score
+    """
+    folder = tmp_path / 'functions'
+    folder.mkdir()
+    (folder / 'moulinette.py').write_text(REGISTRY_MOULINETTE)
+    (folder / 'student_1.py').write_text('def f(n):\n    while n != 0:\n        n = n - 1\n'
+                                         '    return n\n')
+    (folder / 'student_2.py').write_text('x = 1\n\n\ndef f(n):\n    return n\n')
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(folder), '--no-cache', '-j', '2', '-t', '5', '-o', str(output)])
+
+    assert output.read_text().splitlines() == [
+        'Student;Grade;Comment',
+        'student_1;1;exercice_1 0, exercice_2: Timeout',
+        'student_2;3;exercice_1 1, exercice_2 OK',
+    ]
+
+
+def test_registry_tests_run_on_fresh_modules(tmp_path):
+    """
+    Each test of a registry runs on a module of its own, even on the same worker
+    """
+    folder = tmp_path / 'functions'
+    folder.mkdir()
+    (folder / 'moulinette.py').write_text(
+        'from helper.registry import TestRegistry\n\ntests = TestRegistry()\n\n\n'
+        + ''.join(f'@tests.test()\ndef exercice_{i}(module, report):\n'
+                  f'    module.calls = getattr(module, "calls", 0) + module.f(1)\n'
+                  f'    report.add_bonus_note(f"exercice_{i} {{module.calls}}")\n\n\n'
+                  for i in (1, 2))
+        + 'run = tests.run\n')
+    (folder / 'student_1.py').write_text('def f(n):\n    return n\n')
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(folder), '--no-cache', '-j', '1', '-o', str(output)])
+
+    assert output.read_text().splitlines() == [
+        'Student;Grade;Comment',
+        'student_1;2;exercice_1 1, exercice_2 1',
+    ]
+
+
+def test_registry_timeouts_not_cached(tmp_path, capsys):
+    """
+    A submission with a test that timed out is graded again by the next run
+    """
+    folder = tmp_path / 'functions'
+    folder.mkdir()
+    (folder / 'moulinette.py').write_text(REGISTRY_MOULINETTE)
+    (folder / 'student_1.py').write_text('def f(n):\n    while n != 0:\n        n = n - 1\n'
+                                         '    return n\n')
+    (folder / 'student_2.py').write_text('x = 1\n\n\ndef f(n):\n    return n\n')
+    for _ in range(2):
+        mouli_runner([str(folder), '--cache-dir', str(tmp_path / 'cache'), '-j', '2'])
+    out = capsys.readouterr().out
+    assert out.count('student_1 started') == 2 and out.count('student_2 started') == 1
+    assert 'student_2 cached' in out
+
+
+def test_identical_submissions_graded_once(tmp_path, capsys):
+    """
+    Identical submissions are graded once, and similar ones are reported in groups
+    """
+    folder = tmp_path / 'functions'
+    folder.mkdir()
+    (folder / 'moulinette.py').write_text('def run(module, report):\n'
+                                          '    report.add_bonus_note(str(module.f(2)))\n')
+    for name, code in {'a': 'def f(n):\n    return n + 1\n', 'b': 'def f(n):\n    return n + 1\n',
+                       'c': 'def f(m):  # mine\n    return m + 2\n',
+                       'd': 'def f(n):\n    return n * 2\n'}.items():
+        (folder / f'{name}.py').write_text(code)
+    groups = tmp_path / 'groups.json'
+    mouli_runner([str(folder), '--no-cache', '--groups-json', str(groups)])
+
+    out = capsys.readouterr().out
+    assert 'b started' not in out and 'b identical to a submission being graded' in out
+    assert 'a;1;3\nb;1;3\nc;1;4\nd;1;4' in out.replace('\r', '')
+    assert json.loads(groups.read_text()) == [['a', 'b', 'c']]
+
+    # The copies of a report get the congratulation and the usage malus once, as it does
+    folder = tmp_path / 'perfect'
+    folder.mkdir()
+    (folder / 'moulinette.py').write_text('def run(module, report):\n    report.bonus(20)\n')
+    for name in 'abc':
+        (folder / f'{name}.py').write_text('hog = [0] * 10000000\n')
+    for options, row in [([], '20;Congratulations !'),
+                         (['--max-cpu', '0'], '19;Heavy CPU usage: ')]:
+        mouli_runner([str(folder), '--no-cache', *options])
+        out = capsys.readouterr().out
+        for name in 'abc':
+            assert out.count(f'\n{name};') == 1
+            line = out[out.index(f'\n{name};'):].splitlines()[1]
+            assert line.startswith(f'{name};{row}') and line.count(',') == 0
+
+
+def test_archives_graded_without_extracting(tmp_path):
+    """
+    Archives are graded like their folder, with their moulinette inside or next to them, and
+    their members over the size limit are rejected
+    """
+    folder = generate_cohort(tmp_path / 'functions', 4, mix={'clean': 1, 'forbidden': 1})
+    (folder / 'student_9_large.py').write_text('x = 1\n' * 1000)
+    with zipfile.ZipFile(tmp_path / 'cohort.zip', 'w') as f:
+        for file in folder.iterdir():
+            f.write(file, f'functions/{file.name}')
+    (tmp_path / 'tar').mkdir()
+    shutil.copy(folder / 'moulinette.py', tmp_path / 'tar')
+    with tarfile.open(tmp_path / 'tar' / 'cohort.tar.gz', 'w:gz') as f:
+        for file in folder.iterdir():
+            if file.name != 'moulinette.py':
+                f.add(file, file.name)
+
+    outputs = []
+    for target in (folder, tmp_path / 'cohort.zip', tmp_path / 'tar' / 'cohort.tar.gz'):
+        output = tmp_path / f'{target.name}.csv'
+        mouli_runner([str(target), '--no-cache', '--max-size', '4', '-o', str(output)])
+        outputs.append(output.read_text())
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert outputs[0].splitlines()[-1] == \
+           'student_9_large;-1;Submission too large: 5 KiB, limit 4 KiB'
+
+
+def test_archive_students_named_from_their_folders(tmp_path):
+    """
+    The files of per-student folders in an archive are named from their path, and are not
+    taken for the same student
+    """
+    (tmp_path / 'moulinette.py').write_text('def run(module, report):\n'
+                                            '    report.add_bonus_note(str(module.f(1)))\n')
+    with zipfile.ZipFile(tmp_path / 'cohort.zip', 'w') as f:
+        f.writestr('alice/ex.py', 'def f(n):\n    return n\n')
+        f.writestr('bob/ex.py', 'def f(n):\n    return n + 1\n')
+    assert submission_names(tmp_path / 'cohort.zip') == ['alice/ex', 'bob/ex']
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(tmp_path / 'cohort.zip'), '--no-cache', '-o', str(output)])
+
+    assert output.read_text().splitlines() == [
+        'Student;Grade;Comment',
+        'alice/ex;1;1',
+        'bob/ex;1;2',
+    ]
+
+
+def test_watch_survives_a_broken_moulinette(tmp_path, monkeypatch):
+    """
+    A moulinette that does not load keeps the previous grades, and the changes made meanwhile
+    are graded once it loads again
+    """
+    moulinette = 'def run(module, report):\n    report.bonus(module.x)\n'
+    (tmp_path / 'moulinette.py').write_text(moulinette)
+    (tmp_path / 'student.py').write_text('x = 1\n')
+    output = tmp_path / 'output.csv'
+    # The edits made between two polls, the last one stopping the watch
+    edits = iter([('moulinette.py', 'def run(module, report:\n'), ('student.py', 'x = 2\n'),
+                  ('moulinette.py', moulinette + '\n')])
+    grades = []
+
+    def sleep(_):
+        with output.open(newline='') as f:
+            grades.append([row[1] for row in csv.reader(f, delimiter=';')][1:])
+        name, source = next(edits, (None, None))
+        if name is None:
+            raise KeyboardInterrupt
+        (tmp_path / name).write_text(source)
+
+    monkeypatch.setattr('mouli_runner.time.sleep', sleep)
+    mouli_runner([str(tmp_path), '--watch', '--no-cache', '-j', '1', '-o', str(output)])
+    assert grades == [['1'], ['1'], ['1'], ['2']]
+
+
+def test_watch_table_exported_in_the_output_format(tmp_path):
+    """
+    The table of a watch is written as JSON Lines or SQLite when the output asks for it
+    """
+    report = Report('student')
+    report.add_malus_note('Timeout')
+    write_table({'student': report}, tmp_path / 'grades.jsonl', 'folder')
+    assert [json.loads(line) for line in (tmp_path / 'grades.jsonl').read_text().splitlines()] \
+        == [{'folder': 'folder', 'student': 'student', 'score': -1, 'violations': {},
+             'notes': ['Timeout']}]
+    write_table({'student': report}, tmp_path / 'grades.sqlite', 'folder')
+    assert (tmp_path / 'grades.sqlite').read_bytes().startswith(b'SQLite format 3')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['grades.jsonl', 'grades.sqlite']
+
+
+def test_watch_checks_usage(tmp_path, monkeypatch):
+    """
+    A watch gives the same usage malus and columns as a full run, and a perfect score with a
+    malus is not congratulated
+    """
+    (tmp_path / 'moulinette.py').write_text('def run(module, report):\n    report.bonus(20)\n')
+    (tmp_path / 'student.py').write_text('hog = [0] * 10000000\n')
+    output = tmp_path / 'output.csv'
+
+    def sleep(_):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr('mouli_runner.time.sleep', sleep)
+    mouli_runner([str(tmp_path), '--watch', '--no-cache', '-j', '1', '-o', str(output),
+                  '--usage', '--max-cpu', '0'])
+    with output.open(newline='') as f:
+        headers, row = csv.reader(f, delimiter=';', escapechar='\\')
+    assert headers == ['Student', 'Grade', 'Comment', 'CPU (s)', 'RSS growth (KiB)', 'Blocks']
+    assert row[1] == '19' and row[2].startswith('Heavy CPU usage') and float(row[3]) > 0
+    assert 'Congratulations' not in row[2]
+
+
+def test_timeout_starts_with_the_execution(tmp_path):
+    """
+    Cleaning and compiling a large submission does not count against its timeout
+    """
+    folder = generate_cohort(tmp_path / 'functions', 1, mix={'clean': 1})
+    student = next(folder.glob('student_*.py'))
+    rng = random.Random(0)
+    student.write_text(SOLUTION + '\n\n' + generate_functions(rng, 4000, 0.))
+    assert 300 * 1024 < student.stat().st_size < DEFAULT_MAX_SIZE
+    output = tmp_path / 'output.csv'
+    mouli_runner([str(folder), '--no-cache', '-t', '0.05', '-o', str(output)])
+    with output.open(newline='') as f:
+        _, row = csv.reader(f, delimiter=';', escapechar='\\')
+    assert row[1:] == ['2', 'exercice_1 OK, exercice_2 OK']
+
+
+def test_watch_survives_unreadable_submissions(tmp_path, monkeypatch):
+    """
+    A submission that is not UTF-8 gets a malus row, and one deleted before being read is
+    skipped, without ending the watch
+    """
+    (tmp_path / 'moulinette.py').write_text('def run(module, report):\n    report.bonus(1)\n')
+    (tmp_path / 'a.py').write_text('x = 1\n')
+    (tmp_path / 'b.py').write_bytes('x = "é"\n'.encode('latin-1'))
+    output = tmp_path / 'output.csv'
+    rows = []
+
+    def sleep(_):
+        with output.open(newline='') as f:
+            rows.append(list(csv.reader(f, delimiter=';', escapechar='\\'))[1:])
+        if len(rows) == 2:
+            raise KeyboardInterrupt
+        (tmp_path / 'b.py').write_text('x = "é"\n')
+
+    monkeypatch.setattr('mouli_runner.time.sleep', sleep)
+    mouli_runner([str(tmp_path), '--watch', '--no-cache', '-j', '1', '-o', str(output)])
+    assert rows[0] == [['a', '1', ''], ['b', '-1', 'Not a valid python file: invalid '
+                                                    'continuation byte at byte 5']]
+    assert rows[1] == [['a', '1', ''], ['b', '1', '']]
+
+    with WorkerPool([tmp_path], processes=1) as p:
+        reports = list(iter_reports(tmp_path, p=p, files=[tmp_path / 'c.py', tmp_path / 'a.py']))
+    assert [report.student_name for report in reports] == ['a']
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from helper.profiling import Profile, percentile
+from helper.report import Report
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == \
+           (50., 99., 100.)
+    assert percentile([], 50) == 0.
+
+
+def test_profile_totals_skip_nested_phases(tmp_path):
+    """
+    The time spent cleaning, compiling and executing the student code in a worker counts once,
+    as part of the worker phase, and the static analysis done without a worker counts
+    """
+    profile = Profile()
+    for name, worker in [('student_1', .5), ('student_2', .1)]:
+        report = Report(name)
+        report.timings = {'read': .1, 'clean': worker / 4, 'worker': worker, 'exec': worker / 2}
+        profile.record(report)
+    report = Report('student_3')
+    report.timings = {'read': .1, 'clean': .2}
+    profile.record(report)
+    report = Report('student_4')
+    report.timings = {'read': .1, 'worker': .3, 'static': .2}
+    profile.record(report)
+
+    assert profile.totals() == pytest.approx({'student_1': .6, 'student_2': .2, 'student_3': .3,
+                                              'student_4': .6})
+    assert profile.slowest(2) == [('student_1', 'worker', .5), ('student_4', 'worker', .3)]
+    assert profile.phases()['exec']['max'] == .25
+
+    profile.dump(tmp_path / 'profile.json')
+    assert json.loads((tmp_path / 'profile.json').read_text())['students']['student_2'] == \
+           {'read': .1, 'clean': .025, 'worker': .1, 'exec': .05}
@@ -0,0 +1,33 @@
+import pickle
+import sys
+
+from helper.clean_code import ast_clean
+from helper.report import Report
+
+
+def test_report_pickle_round_trip():
+    """
+    Violations travel as (code, count, detail) entries and their text is built on reading
+    """
+    _, report = ast_clean('import os\nfor i in x:\n    pass\n', Report('student'))
+    report.add_bonus_note('Good job', 2)
+    restored = pickle.loads(pickle.dumps(report))
+    assert restored.entries == [('import', 1, 'os'), ('for', 1, None), (None, 0, 'Good job')]
+    assert restored.notes == ['Forbidden imports: os', 'Forbidden for loops: 1', 'Good job']
+    assert (restored.student_name, restored.score) == ('student', 0)
+    assert restored.entries[1][0] is sys.intern('for')
+    assert not hasattr(restored, '__dict__')
+
+
+def test_notes_edit_the_entries():
+    """
+    Notes added or removed through the list of notes are kept on the report
+    """
+    report = Report('student')
+    report.add_violation('for', 2)
+    report.notes.append('Good job')
+    report.notes.extend(['Well done', 'Try again'])
+    del report.notes[-1]
+    report.notes[1] = 'Great job'
+    assert report.notes == ['Forbidden for loops: 2', 'Great job', 'Well done']
+    assert report.entries[1:] == [(None, 0, 'Great job'), (None, 0, 'Well done')]
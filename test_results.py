@@ -0,0 +1,55 @@
+import json
+import sqlite3
+from io import StringIO
+
+from helper.clean_code import ast_clean
+from helper.report import Report
+from helper.results import ResultStore
+
+
+def make_store() -> ResultStore:
+    store = ResultStore()
+    sources = {'student_2': 'for i in x:\n    pass\nfor j in x:\n    pass\n',
+               'student_1': 'import os\nfor i in x:\n    pass\n',
+               'student_3': 'x = 1\n'}
+    for name, source in sources.items():
+        _, report = ast_clean(source, Report(name))
+        report.add_bonus_note('exercice_1 OK', 2)
+        store.add(report, 'functions')
+    return store
+
+
+def test_result_store_queries():
+    """
+    Aggregates are answered from the columns, without the text of the notes
+    """
+    store = make_store()
+    assert store.students_with('for') == 2 and store.students_with('while_else') == 0
+    assert store.rule_counts() == {'for': (2, 3), 'import': (1, 1)}
+    assert store.score_histogram() == {0: 2, 2: 1}
+    assert store.report(1).notes == ['Forbidden imports: os', 'Forbidden for loops: 1',
+                                     'exercice_1 OK']
+
+
+def test_result_store_exports(tmp_path):
+    """
+    Reports are exported sorted by student, as JSON Lines and as an indexed sqlite database
+    """
+    store = make_store()
+    output = StringIO()
+    store.to_jsonl(output)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line['student'] for line in lines] == ['student_1', 'student_2', 'student_3']
+    assert lines[1] == {'folder': 'functions', 'student': 'student_2', 'score': 0,
+                        'violations': {'for': 2},
+                        'notes': ['Forbidden for loops: 2', 'exercice_1 OK']}
+
+    store.export(tmp_path / 'results.sqlite')
+    db = sqlite3.connect(tmp_path / 'results.sqlite')
+    assert db.execute("SELECT COUNT(DISTINCT student_id) FROM entries WHERE rule = 'for'"
+                      ).fetchone() == (2,)
+    assert db.execute('SELECT student, score FROM students ORDER BY student').fetchall() == \
+           [('student_1', 0.), ('student_2', 0.), ('student_3', 2.)]
+    assert {'students_student', 'entries_rule'} <= \
+           {name for name, in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    db.close()
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pytest
+
+from helper.report import Report
+from helper.schedule import Scheduler, list_makespan
+from mouli_runner import Batch, batch_submissions
+
+
+def test_list_makespan():
+    assert list_makespan([1., 1., 4.], 2) == 5.
+    assert list_makespan([4., 1., 1.], 2) == 4.
+
+
+def test_scheduler_expects_the_times_of_the_last_run(tmp_path: Path):
+    """
+    Students are expected to take the time they took in the previous run, and the others are
+    estimated from their size
+    """
+    history = tmp_path / 'history.json'
+    scheduler = Scheduler(history)
+    for student, seconds in [('fast', 0.1), ('slow', 2.)]:
+        scheduler.cost(tmp_path, student, 6)
+        report = Report(student)
+        report.timings['worker'] = seconds
+        scheduler.record(tmp_path, report)
+    scheduler.save()
+    assert scheduler.summary(1).endswith('2.100 s slowest first, 2.100 s in listing order')
+    assert scheduler.summary(2).endswith('2.000 s slowest first, 2.000 s in listing order')
+
+    scheduler = Scheduler(history)
+    assert scheduler.cost(tmp_path, 'slow', 0) == 2.
+    assert scheduler.cost(tmp_path, 'fast', 0) == 0.1
+    assert scheduler.cost(tmp_path, 'new', 60) == pytest.approx(60 * 2.1 / 12)
+
+
+def test_folders_are_read_costliest_first(tmp_path: Path):
+    """
+    The submissions of a folder are read by decreasing expected cost, without parsing them
+    """
+    for name, size in [('a', 10), ('b', 30), ('c', 20)]:
+        (tmp_path / f'{name}.py').write_text('#' * size)
+    scheduler = Scheduler()
+    files = [file.stem for _, file, _ in batch_submissions(Batch(tmp_path), scheduler)]
+    assert files == ['b', 'c', 'a']
+    assert sorted(student for _, student in scheduler.order) == ['a', 'b', 'c']
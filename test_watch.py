@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+
+from helper.watch import Changes, FolderWatcher
+
+
+def test_watcher_reports_content_changes(tmp_path: Path):
+    """
+    Only new, modified and deleted submissions are reported, and moulinette changes apart
+    """
+    (tmp_path / 'moulinette.py').write_text('def run(module, report): ...')
+    (tmp_path / 'student_1.py').write_text('x = 1')
+    (tmp_path / 'student_2.py').write_text('x = 2')
+    (tmp_path / 'notes.txt').write_text('not a submission')
+    watcher = FolderWatcher(tmp_path)
+    first = watcher.poll()
+    assert sorted(first.modified) == [tmp_path / 'student_1.py', tmp_path / 'student_2.py']
+    assert watcher.poll() == Changes([], [], False)
+
+    # Touching a file without changing its content does not count as a modification
+    os.utime(tmp_path / 'student_1.py', ns=(0, 0))
+    (tmp_path / 'student_2.py').write_text('x = 22')
+    (tmp_path / 'student_3.py').write_text('x = 3')
+    changes = watcher.poll()
+    assert sorted(changes.modified) == [tmp_path / 'student_2.py', tmp_path / 'student_3.py']
+
+    (tmp_path / 'student_3.py').unlink()
+    (tmp_path / 'moulinette.py').write_text('def run(module, report): pass')
+    assert watcher.poll() == Changes([], [tmp_path / 'student_3.py'], True)
@@ -0,0 +1,131 @@
+import pickle
+import time
+from pathlib import Path
+
+from helper.report import Report
+from helper.workers import WorkerPool, freeze, run_in_process
+from mouli_runner import check_usage
+
+MOULINETTE = '''
+def run(module, report):
+    report.add_bonus_note(f'{module.f()}')
+'''
+
+
+def spin() -> None:
+    while True:
+        pass
+
+
+def test_pool_grades_several_folders(tmp_path: Path):
+    """
+    Workers load the moulinettes of every folder they grade, and are recycled
+    """
+    targets = [tmp_path / 'exercice_1', tmp_path / 'exercice_2']
+    for target in targets:
+        target.mkdir()
+        (target / 'moulinette.py').write_text(MOULINETTE)
+
+    with WorkerPool(targets[:1], processes=2, max_tasks=2) as p:
+        for i, target in enumerate(targets * 3):
+            p.submit(i, run_in_process, target, f'def f():\n    return {i}\n',
+                     target / f'student_{i}.py', Report(f'student_{i}'))
+        results = sorted(p.results())
+    assert [(result.key, result.value.notes) for result in results] == \
+           [(i, [str(i)]) for i in range(6)]
+
+
+def test_pool_timeout_only_costs_its_budget():
+    """
+    A task that misses its deadline is killed without delaying the next ones
+    """
+    with WorkerPool(processes=1, timeout=0.5) as p:
+        p.submit('spin', spin)
+        p.submit('sum', sum, (1, 2))
+        start = time.monotonic()
+        results = list(p.results())
+        elapsed = time.monotonic() - start
+    assert [tuple(result)[:3] for result in results] == [('spin', None, 'Timeout'),
+                                                         ('sum', 3, None)]
+    assert elapsed < 1.5
+    assert results[0].timings['worker'] >= 0.5 > results[1].timings['worker']
+    assert results[1].timings['queue'] >= 0.5
+
+
+def test_usage_of_a_submission(tmp_path: Path):
+    """
+    The resources a submission uses are on its report, and are freed once it ran
+    """
+    (tmp_path / 'moulinette.py').write_text(MOULINETTE)
+    hog = 'hog = [0] * 10000000\n\n\ndef f():\n    return 1\n'
+    usages = []
+    for i in range(2):
+        report = run_in_process(tmp_path, hog, tmp_path / 'student.py', Report('student'))
+        usages.append(report.usage)
+    for usage in usages:
+        assert usage['cpu_user'] + usage['cpu_system'] >= 0
+        assert usage['peak_rss'] > 50 * 1024 or not Path('/proc/self/statm').exists()
+
+    report = check_usage(report, max_cpu=None, max_rss=10)
+    assert report.notes[-1].startswith('Heavy memory usage') or \
+           not Path('/proc/self/statm').exists()
+
+
+def test_fixtures_set_up_once(tmp_path: Path):
+    """
+    The fixtures of a moulinette are set up once by the pool, and given to every run
+    """
+    (tmp_path / 'moulinette.py').write_text(f'''
+def setup():
+    with open({str(tmp_path / 'setups')!r}, 'a') as f:
+        f.write('setup\\n')
+    return list(range(1000))
+
+
+def run(module, report, fixtures):
+    report.add_bonus_note(f'{{module.f(fixtures)}}')
+''')
+    with WorkerPool([tmp_path], processes=2) as p:
+        for i in range(6):
+            p.submit(i, run_in_process, tmp_path, f'def f(data):\n    return data[{i}]\n',
+                     tmp_path / f'student_{i}.py', Report(f'student_{i}'))
+        results = sorted(p.results())
+    assert [result.value.notes for result in results] == [[str(i)] for i in range(6)]
+    assert (tmp_path / 'setups').read_text() == 'setup\n'
+
+
+def test_fixtures_are_read_only(tmp_path: Path):
+    """
+    A submission cannot change the fixtures given to the next ones graded by its worker
+    """
+    (tmp_path / 'moulinette.py').write_text('''
+def setup():
+    return {'data': [3, 1, 2], 'seen': set()}
+
+
+def run(module, report, fixtures):
+    try:
+        module.f(fixtures['data'])
+    except TypeError:
+        pass
+    report.add_bonus_note(str(fixtures['data']))
+''')
+    with WorkerPool([tmp_path], processes=1) as p:
+        for i in range(4):
+            p.submit(i, run_in_process, tmp_path, 'def f(t):\n    t[0] = t[2]\n',
+                     tmp_path / f'student_{i}.py', Report(f'student_{i}'))
+        results = sorted(p.results())
+    assert [result.value.notes for result in results] == [['(3, 1, 2)']] * 4
+    fixtures = pickle.loads(pickle.dumps(freeze({'data': [[1], bytearray(b'a')], 'seen': {2}})))
+    assert fixtures == {'data': ((1,), b'a'), 'seen': frozenset({2})}
+
+
+def test_pool_starts_costly_tasks_first():
+    """
+    A task starts as soon as it is submitted to a free worker, the queued ones by decreasing cost
+    """
+    with WorkerPool(processes=1) as p:
+        for key, cost in [('a', 0.), ('b', 0.), ('c', 2.), ('d', 1.), ('e', 2.)]:
+            p.submit(key, sum, (1, 2), cost=cost)
+        assert p.queued == 4
+        assert [result.key for result in p.results()] == ['a', 'c', 'e', 'd', 'b']